@@ -0,0 +1,72 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Etapas do pipeline: load, normalize, line_removal, orientation, skew,
+# segmentation, inference, db_write, image_write
+STAGE_SECONDS = Histogram(
+    "ocr_stage_seconds",
+    "Duração de cada etapa do pipeline OCR",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+DOCUMENTS_PROCESSED = Counter(
+    "ocr_documents_processed_total", "Documentos processados pelo worker", ["status"]
+)
+PAGES_PROCESSED = Counter("ocr_pages_processed_total", "Páginas processadas pelo worker")
+LINES_PROCESSED = Counter("ocr_lines_processed_total", "Segmentos de linha lidos pelo worker")
+
+QUEUE_DEPTH = Gauge("ocr_queue_depth", "Documentos à espera de processamento (status 'uploaded')")
+
+# Servidor de inferência: linhas e pedidos (páginas) juntos em cada lote
+INFERENCE_BATCH_LINES = Histogram(
+    "ocr_inference_batch_lines",
+    "Linhas por lote do servidor de inferência",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+INFERENCE_BATCH_REQUESTS = Histogram(
+    "ocr_inference_batch_requests",
+    "Pedidos (páginas de vários workers) por lote do servidor de inferência",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latência dos pedidos à API",
+    ["method", "route", "status"],
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Mede um bloco de código como uma etapa: with stage("db_write"): ..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def observe_stages(timings: dict):
+    """Regista tempos já medidos noutro processo ({etapa: segundos})."""
+    for name, seconds in timings.items():
+        STAGE_SECONDS.labels(name).observe(seconds)
+
+
+def start_metrics_server(port: int, attempts: int = 1):
+    """
+    Expõe /metrics na primeira porta livre entre port e port + attempts - 1
+    (vários workers na mesma máquina ficam em portas seguidas).
+    Devolve a porta usada, ou None se estiverem todas ocupadas: as métricas
+    são opcionais e nunca impedem o processo de arrancar.
+    """
+    for candidate in range(port, port + max(1, attempts)):
+        try:
+            start_http_server(candidate)
+            return candidate
+        except OSError:
+            continue
+    print(f"⚠️ Portas de métricas {port}-{port + max(1, attempts) - 1} ocupadas. Métricas desligadas.")
+    return None
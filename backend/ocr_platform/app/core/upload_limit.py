@@ -0,0 +1,53 @@
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app.core.config import MAX_UPLOAD_BYTES, MAX_BULK_UPLOAD_BYTES
+
+# Folga para os cabeçalhos do multipart (nome do campo, filename, content-type...)
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Limite do corpo do pedido por rota de upload
+UPLOAD_LIMITS = {
+    "/documents/upload": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    "/documents/upload/bulk": MAX_BULK_UPLOAD_BYTES,
+}
+
+
+def _too_large(limit: int) -> str:
+    return f"Pedido excede {limit} bytes"
+
+
+class UploadSizeLimit:
+    """
+    Middleware ASGI que corta os uploads grandes demais logo à entrada,
+    antes de o Starlette gravar o multipart inteiro num ficheiro temporário:
+      1. Content-Length acima do limite -> 413 sem ler o corpo;
+      2. sem Content-Length (chunked), conta os bytes recebidos e pára no limite.
+    O limite por ficheiro continua a ser verificado ao gravar (save_upload).
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = UPLOAD_LIMITS.get(scope["path"].rstrip("/")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": _too_large(limit)}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Levantado durante a leitura do formulário: a rota responde 413
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,14 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import documents, ocr
+from app.routes import documents, ocr, metrics
+from app.core.metrics import HTTP_REQUEST_SECONDS
+from app.core.upload_limit import UploadSizeLimit
 import os
+import time
 
 app = FastAPI(
     title="OCR Inteligente – Registos de Angola",
     version="0.1.0"
 )
 
+# Uploads grandes demais são recusados (413) antes de o corpo ser gravado em disco.
+# Registado antes do CORS para ficar por dentro dele: o 413 também leva os cabeçalhos
+# CORS (senão o browser só vê um erro de CORS, e não "ficheiro grande demais")
+app.add_middleware(UploadSizeLimit)
+
 # 1. Configurar CORS
 # Isto permite que o ficheiro HTML (que vamos criar) consiga falar com a API
 # sem que o navegador bloqueie por segurança.
@@ -18,16 +26,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-After"],  # Paginação dos segmentos
 )
 
+# Medir a latência de cada pedido (por rota, não por URL, para não explodir o nº de séries)
+@app.middleware("http")
+async def measure_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method,
+            route.path if route else "desconhecida",
+            str(status)
+        ).observe(time.perf_counter() - start)
+
 # 2. Criar pastas necessárias (segurança extra)
 os.makedirs("segments", exist_ok=True)
 os.makedirs("uploads", exist_ok=True)
 
 # 3. Montar a pasta de segmentos como "estática"
-# Agora, se acederes a /segments/imagem.png, a API devolve a imagem
+# Só para os PNG antigos (um ficheiro por linha); os recortes novos estão em pacotes
+# por documento e são servidos por GET /ocr/segments/{id}/image
 app.mount("/segments", StaticFiles(directory="segments"), name="segments")
 
 # 4. Registar Rotas
 app.include_router(documents.router, prefix="/documents", tags=["Documents"])
-app.include_router(ocr.router, prefix="/ocr", tags=["OCR"])
\ No newline at end of file
+app.include_router(ocr.router, prefix="/ocr", tags=["OCR"])
+app.include_router(metrics.router, tags=["Métricas"])
\ No newline at end of file
@@ -1,11 +1,14 @@
-from sqlalchemy import Column, Integer, ForeignKey, Text, DateTime
+from sqlalchemy import Column, Integer, ForeignKey, Text, DateTime, Index
 from sqlalchemy.sql import func
 from app.models.base import Base
 
 class CorrecaoHumana(Base):
     __tablename__ = "correcoes_humanas"
+    # Uma só correção por segmento: correções novas substituem a anterior (upsert)
+    __table_args__ = (Index("uq_correcoes_humanas_segmento_id", "segmento_id", unique=True),)
 
     id = Column(Integer, primary_key=True)
     segmento_id = Column(Integer, ForeignKey("ocr_segmentos.id"))
     texto_corrigido = Column(Text, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
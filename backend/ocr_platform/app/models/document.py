@@ -1,12 +1,30 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index, ForeignKey
 from sqlalchemy.sql import func
 from app.models.base import Base
 
 class Document(Base):
     __tablename__ = "documents"
+    # Consulta da fila do worker: status = 'uploaded' ORDER BY created_at
+    __table_args__ = (Index("ix_documents_status_created_at", "status", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     storage_path = Column(String, nullable=False)
+    # SHA-256 do ficheiro, calculado durante o upload
+    content_hash = Column(String(64), nullable=True, index=True)
+    # Upload repetido: os resultados são os do documento original (status 'duplicate')
+    duplicate_of = Column(Integer, ForeignKey("documents.id"), nullable=True)
     status = Column(String, default="uploaded")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Progresso por página (documentos multi-página)
+    num_paginas = Column(Integer, nullable=True)
+    paginas_processadas = Column(Integer, default=0)
+
+    # Média da confiança de todas as linhas lidas (0-1)
+    confidence_global = Column(Float, nullable=True)
+
+    # Fila de trabalho: qual worker tem o documento e até quando
+    locked_by = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, default=0)
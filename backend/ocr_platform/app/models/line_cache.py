@@ -0,0 +1,17 @@
+from datetime import datetime
+from sqlalchemy import String, Text, Float, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from app.models.base import Base
+
+class OCRCacheLinha(Base):
+    """Cache partilhada: texto já lido para um recorte de linha idêntico."""
+    __tablename__ = "ocr_cache_linhas"
+
+    # SHA-256 da imagem da linha pré-processada + versão do modelo que a leu
+    # (com backend e estratégia de decodificação: 'versão|backend|estratégia')
+    image_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    model_version: Mapped[str] = mapped_column(String, primary_key=True)
+    texto: Mapped[str] = mapped_column(Text)
+    confidence: Mapped[float] = mapped_column(Float)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Text, Float, Integer
+from sqlalchemy import ForeignKey, String, Text, Float, Integer
 from sqlalchemy.orm import Mapped, mapped_column
 from app.models.base import Base
 
@@ -7,6 +7,10 @@ class OCRResultado(Base):
 
     # FIX: Usar Mapped[...] diz ao Pylance o tipo real da variável
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    document_id: Mapped[int] = mapped_column(Integer, ForeignKey("documents.id"))
+    document_id: Mapped[int] = mapped_column(Integer, ForeignKey("documents.id"), index=True)
+    # Um resultado por página (numeração começa em 1)
+    pagina: Mapped[int] = mapped_column(Integer, default=1)
     texto_completo: Mapped[str] = mapped_column(Text, nullable=True)
-    confidence_global: Mapped[float] = mapped_column(Float, default=0.0)
\ No newline at end of file
+    confidence_global: Mapped[float] = mapped_column(Float, default=0.0)
+    # Versão do modelo TrOCR que produziu este resultado (ver ml/inference/registry.py)
+    model_version: Mapped[str] = mapped_column(String, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, String, Text, Float, Integer
+from sqlalchemy import ForeignKey, String, Text, Float, Integer, BigInteger
 from sqlalchemy.orm import Mapped, mapped_column
 from app.models.base import Base
 
@@ -6,7 +6,18 @@ class OCRSegmento(Base):
     __tablename__ = "ocr_segmentos"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    ocr_resultado_id: Mapped[int] = mapped_column(Integer, ForeignKey("ocr_resultados.id"))
+    ocr_resultado_id: Mapped[int] = mapped_column(Integer, ForeignKey("ocr_resultados.id"), index=True)
+    pagina: Mapped[int] = mapped_column(Integer, default=1)
+    # Posição do recorte na página (pixels da página pré-processada)
+    # Vários segmentos com a mesma 'linha' são pedaços da mesma linha, ordenados por bbox_x
+    linha: Mapped[int] = mapped_column(Integer, nullable=True)
+    bbox_x: Mapped[int] = mapped_column(Integer, nullable=True)
+    bbox_y: Mapped[int] = mapped_column(Integer, nullable=True)
+    bbox_w: Mapped[int] = mapped_column(Integer, nullable=True)
+    bbox_h: Mapped[int] = mapped_column(Integer, nullable=True)
     imagem_path: Mapped[str] = mapped_column(String)
+    # Posição do recorte dentro do pacote do documento (ver app/services/segment_store.py)
+    imagem_offset: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    imagem_tamanho: Mapped[int] = mapped_column(Integer, nullable=True)
     texto_previsto: Mapped[str] = mapped_column(Text)
     confidence: Mapped[float] = mapped_column(Float)
\ No newline at end of file
@@ -1,29 +1,136 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.storage import save_file
-from app.schemas.document import DocumentCreate
+import os
+import zipfile
+from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.services.storage import (
+    save_upload, save_upload_to_tmp, save_stream, UploadTooLarge, ALLOWED_EXTENSIONS
+)
+from app.core.config import MAX_ZIP_UPLOAD_BYTES
+from app.schemas.document import DocumentCreate, DocumentResponse
 from app.models.document import Document
-from app.core.database import SessionLocal
+from app.core.database import SessionFactory, AsyncSessionLocal, get_db
+from app.services.documents import insert_documents
 
 router = APIRouter()
 
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png", "application/pdf"]
+ZIP_CONTENT_TYPES = ["application/zip", "application/x-zip-compressed"]
+
+def _create_documents(files, force: bool = False) -> list:
+    """
+    Insere todos os Documents numa só transação e acorda os workers.
+    'files' é uma lista de (filename, caminho, sha256). Corre numa thread.
+    """
+    db = SessionFactory()
+    try:
+        created = insert_documents(db, files, force)
+        db.commit()
+        return created
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def _create_documents_async(files, force: bool = False) -> list:
+    """Igual ao _create_documents, mas com o motor assíncrono (ASYNC_DATABASE_URL)."""
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            return await db.run_sync(insert_documents, files, force)
+
+async def create_documents(files, force: bool = False) -> list:
+    """Usa o motor assíncrono se estiver configurado; senão a BD síncrona numa thread."""
+    if AsyncSessionLocal is not None:
+        return await _create_documents_async(files, force)
+    return await run_in_threadpool(_create_documents, files, force)
+
+def _extract_zip(zip_path: str) -> list:
+    """Grava (endereçado pelo conteúdo) cada PDF/imagem de um zip. Corre numa thread."""
+    files = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for entry in archive.infolist():
+            name = os.path.basename(entry.filename)
+            if entry.is_dir() or os.path.splitext(name)[1].lower() not in ALLOWED_EXTENSIONS:
+                continue
+            with archive.open(entry) as stream:
+                path, digest, _ = save_stream(stream, name)
+            files.append((name, path, digest))
+    return files
+
 @router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    if file.content_type not in ["image/jpeg", "image/png", "application/pdf"]:
+async def upload_document(
+    file: UploadFile = File(...),
+    force: bool = Query(False, description="Processar de novo mesmo que o ficheiro já tenha sido lido"),
+):
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(status_code=400, detail="Formato não suportado")
 
-    file_path = save_file(file)
+    try:
+        file_path, digest, _ = await save_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-    db = SessionLocal()
-    document = Document(
-        filename=file.filename,
-        storage_path=file_path,
-        status="uploaded"
-    )
-    db.add(document)
-    db.commit()
-    db.refresh(document)
+    created = await create_documents([(file.filename, file_path, digest)], force)
 
     return {
-        "document_id": document.id,
-        "status": document.status
+        "document_id": created[0]["document_id"],
+        "status": created[0]["status"],
+        "duplicate_of": created[0]["duplicate_of"]
     }
+
+@router.post("/upload/bulk")
+async def upload_documents_bulk(
+    files: List[UploadFile] = File(...),
+    force: bool = Query(False, description="Processar de novo mesmo que o ficheiro já tenha sido lido"),
+):
+    """
+    Upload de muitos ficheiros (PDF/imagens e/ou arquivos .zip) num só pedido.
+    Todos os Documents são criados numa única transação: ou entram todos, ou nenhum.
+    Ficheiros já lidos com o modelo atual não voltam à fila (status 'duplicate').
+    """
+    stored = []
+    for file in files:
+        is_zip = file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+        if not is_zip and file.content_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(status_code=400, detail=f"Formato não suportado: {file.filename}")
+
+        try:
+            if is_zip:
+                # O zip vai para um temporário e é extraído entrada a entrada numa thread
+                zip_path, _, _ = await save_upload_to_tmp(file, MAX_ZIP_UPLOAD_BYTES)
+                try:
+                    stored.extend(await run_in_threadpool(_extract_zip, zip_path))
+                finally:
+                    os.remove(zip_path)
+            else:
+                path, digest, _ = await save_upload(file)
+                stored.append((file.filename, path, digest))
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail=f"Zip inválido: {file.filename}")
+
+    if not stored:
+        raise HTTPException(status_code=400, detail="Nenhum PDF ou imagem encontrado")
+
+    created = await create_documents(stored, force)
+    return {"total": len(created), "documents": created}
+
+@router.get("/{document_id}", response_model=DocumentResponse)
+def get_document(document_id: int, db: Session = Depends(get_db)):
+    """Estado do documento, incluindo o progresso página a página."""
+    document = db.get(Document, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+
+    response = DocumentResponse.model_validate(document)
+    if document.duplicate_of:
+        # Upload repetido: o progresso e os resultados são os do original
+        original = db.get(Document, document.duplicate_of)
+        response.status = original.status
+        response.num_paginas = original.num_paginas
+        response.paginas_processadas = original.paginas_processadas
+        response.confidence_global = original.confidence_global
+    return response
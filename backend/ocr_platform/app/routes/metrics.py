@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from app.core.database import SessionFactory
+from app.core.metrics import QUEUE_DEPTH
+from app.services.queue import count_pending_documents
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas da API no formato Prometheus (as do worker estão na WORKER_METRICS_PORT)."""
+    db = SessionFactory()
+    try:
+        QUEUE_DEPTH.set(count_pending_documents(db))
+    except Exception as e:
+        print(f"⚠️ Erro ao medir a fila: {e}")
+    finally:
+        db.close()
+
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,24 +1,158 @@
-from fastapi import APIRouter
-from app.core.database import SessionLocal
+import hashlib
+from typing import List, Optional
+from fastapi import APIRouter, Request, Response, Query, Depends, HTTPException
+from sqlalchemy import exists, func
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from app.core.database import get_db
+from app.services.segment_store import read_crop, media_type
+from app.services.documents import resolve_document_id
+from app.models.ocr import OCRResultado
 from app.models.segment import OCRSegmento
 from app.models.correction import CorrecaoHumana
+from app.schemas.correction import CorrectionCreate
 
 router = APIRouter()
 
 @router.get("/segments/{document_id}")
-def get_segments(document_id: int):
-    db = SessionLocal()
-    return db.query(OCRSegmento).all()
+def get_segments(
+    document_id: int,
+    request: Request,
+    response: Response,
+    after: Optional[int] = Query(None, description="Cursor: devolve segmentos com id > after"),
+    limit: int = Query(100, ge=1, le=1000),
+    pagina: Optional[int] = None,
+    min_confidence: Optional[float] = None,
+    max_confidence: Optional[float] = None,
+    corrected: Optional[bool] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Segmentos de UM documento, paginados por keyset (id crescente).
+    O cursor da página seguinte vem no header X-Next-After (ausente na última página).
+    Suporta ETag / If-None-Match (304 se nada mudou).
+    """
+    # Um upload repetido mostra os segmentos do documento original
+    document_id = resolve_document_id(db, document_id)
+    is_corrected = exists().where(CorrecaoHumana.segmento_id == OCRSegmento.id)
 
-@router.post("/segments/{segment_id}/correct")
-def correct_segment(segment_id: int, texto_corrigido: str):
-    db = SessionLocal()
+    query = db.query(
+        OCRSegmento.id,
+        OCRSegmento.pagina,
+        OCRSegmento.linha,
+        OCRSegmento.imagem_path,
+        OCRSegmento.texto_previsto,
+        OCRSegmento.confidence,
+        is_corrected.label("corrigido"),
+    )\
+        .join(OCRResultado, OCRSegmento.ocr_resultado_id == OCRResultado.id)\
+        .filter(OCRResultado.document_id == document_id)
+
+    if pagina is not None:
+        query = query.filter(OCRSegmento.pagina == pagina)
+    if min_confidence is not None:
+        query = query.filter(OCRSegmento.confidence >= min_confidence)
+    if max_confidence is not None:
+        query = query.filter(OCRSegmento.confidence <= max_confidence)
+    if corrected is not None:
+        query = query.filter(is_corrected if corrected else ~is_corrected)
+
+    # ETag: muda quando aparecem segmentos ou quando se grava/altera uma correção neste documento
+    version = db.query(
+        func.count(OCRSegmento.id),
+        func.max(OCRSegmento.id),
+        func.max(CorrecaoHumana.updated_at),
+    )\
+        .select_from(OCRSegmento)\
+        .join(OCRResultado, OCRSegmento.ocr_resultado_id == OCRResultado.id)\
+        .outerjoin(CorrecaoHumana, CorrecaoHumana.segmento_id == OCRSegmento.id)\
+        .filter(OCRResultado.document_id == document_id)\
+        .one()
+    etag = 'W/"' + hashlib.sha1(f"{version}|{request.url.query}".encode()).hexdigest() + '"'
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if after is not None:
+        query = query.filter(OCRSegmento.id > after)
+
+    # Pede um a mais para saber se há página seguinte
+    rows = query.order_by(OCRSegmento.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    response.headers["ETag"] = etag
+    if has_more:
+        response.headers["X-Next-After"] = str(rows[-1].id)
+
+    return [dict(row._mapping) for row in rows]
 
-    correction = CorrecaoHumana(
-        segmento_id=segment_id,
-        texto_corrigido=texto_corrigido
+@router.get("/segments/{segment_id}/image")
+def get_segment_image(segment_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Recorte de um segmento, lido por offset do pacote do documento.
+    Um recorte nunca muda depois de gravado: cache longa no navegador/proxy.
+    """
+    segment = db.query(
+        OCRSegmento.imagem_path,
+        OCRSegmento.imagem_offset,
+        OCRSegmento.imagem_tamanho,
+    )\
+        .filter(OCRSegmento.id == segment_id)\
+        .first()
+    if not segment:
+        raise HTTPException(status_code=404, detail="Segmento não encontrado")
+
+    etag = f'"{segment_id}-{segment.imagem_offset}-{segment.imagem_tamanho}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = read_crop(segment.imagem_path, segment.imagem_offset, segment.imagem_tamanho)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Imagem do segmento não encontrada")
+
+    return Response(content=data, media_type=media_type(data), headers=headers)
+
+def _upsert_corrections(db: Session, texts: dict) -> int:
+    """
+    Grava {segmento_id: texto} numa só transação.
+    Valida que todos os segmentos existem (uma query) e substitui correções anteriores.
+    """
+    found = {
+        segment_id for (segment_id,) in db.query(OCRSegmento.id)
+        .filter(OCRSegmento.id.in_(texts))
+    }
+    missing = sorted(set(texts) - found)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Segmentos não encontrados: {missing}")
+
+    statement = insert(CorrecaoHumana).values([
+        {"segmento_id": segment_id, "texto_corrigido": text}
+        for segment_id, text in texts.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[CorrecaoHumana.segmento_id],
+        set_={"texto_corrigido": statement.excluded.texto_corrigido, "updated_at": func.now()}
     )
-    db.add(correction)
+    db.execute(statement)
     db.commit()
+    return len(texts)
 
+@router.post("/segments/{segment_id}/correct")
+def correct_segment(segment_id: int, texto_corrigido: str, db: Session = Depends(get_db)):
+    _upsert_corrections(db, {segment_id: texto_corrigido})
     return {"status": "correction_saved"}
+
+@router.post("/corrections")
+def correct_segments(corrections: List[CorrectionCreate], db: Session = Depends(get_db)):
+    """
+    Correções de uma página/documento inteiro num só pedido (JSON: [{segment_id, text}, ...]).
+    Se o mesmo segmento vier repetido, fica o último texto.
+    """
+    if not corrections:
+        raise HTTPException(status_code=400, detail="Nenhuma correção enviada")
+
+    saved = _upsert_corrections(db, {c.segment_id: c.text for c in corrections})
+    return {"status": "corrections_saved", "total": saved}
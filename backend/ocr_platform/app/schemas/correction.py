@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+class CorrectionCreate(BaseModel):
+    segment_id: int
+    text: str
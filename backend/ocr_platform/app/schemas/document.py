@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 
 class DocumentBase(BaseModel):
     filename: str
@@ -12,6 +13,10 @@ class DocumentResponse(DocumentBase):
     status: str
     storage_path: str
     created_at: datetime
+    num_paginas: Optional[int] = None
+    paginas_processadas: Optional[int] = None
+    confidence_global: Optional[float] = None
+    duplicate_of: Optional[int] = None
 
     class Config:
         from_attributes = True  # Permite ler dados do modelo SQLAlchemy
\ No newline at end of file
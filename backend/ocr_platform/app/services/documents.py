@@ -0,0 +1,85 @@
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Session
+
+from app.models.document import Document
+from app.models.ocr import OCRResultado
+from app.services.queue import lock_content_hash, notify_new_document
+from ml.inference.registry import resolve_current_model
+
+
+def find_reusable_document(db: Session, content_hash: str, model_version: str):
+    """
+    Documento original com o mesmo conteúdo cujo OCR pode ser reaproveitado:
+    ainda na fila/em processamento, ou concluído só com a versão atual do modelo.
+    Se um original na fila acabar em erro, o worker devolve os duplicados à fila
+    (release_duplicates). Chamar com o lock do conteúdo (lock_content_hash).
+    """
+    other_version = exists().where(
+        OCRResultado.document_id == Document.id,
+        or_(OCRResultado.model_version != model_version, OCRResultado.model_version.is_(None))
+    )
+    return db.query(Document)\
+        .filter(
+            Document.content_hash == content_hash,
+            Document.duplicate_of.is_(None),
+            or_(
+                Document.status.in_(("uploaded", "processing")),
+                and_(Document.status == "ocr_completed", ~other_version)
+            )
+        )\
+        .order_by(Document.id.desc())\
+        .first()
+
+
+def insert_documents(db: Session, files, force: bool = False) -> list:
+    """
+    Cria os Documents de um upload (sem commit) e acorda os workers se houver trabalho.
+    'files' é uma lista de (filename, caminho, sha256).
+    Um ficheiro igual a outro já lido (mesmos bytes, mesma versão do modelo) não volta
+    à fila: fica ligado ao original (duplicate_of) e partilha os resultados e segmentos.
+    force=True processa sempre de novo.
+    """
+    model_version, _ = resolve_current_model()
+    originals = {}  # sha256 -> Document original (inclui os criados neste mesmo upload)
+    documents = []
+
+    if not force:
+        # Procurar e inserir sob o lock de cada conteúdo (até ao commit): dois uploads
+        # iguais em simultâneo não entram ambos na fila. Por ordem, para não haver deadlocks.
+        for digest in sorted({digest for _, _, digest in files}):
+            lock_content_hash(db, digest)
+
+    for filename, path, digest in files:
+        original = None
+        if not force:
+            original = originals.get(digest) or find_reusable_document(db, digest, model_version)
+
+        if original is not None:
+            document = Document(
+                filename=filename, storage_path=path, content_hash=digest,
+                status="duplicate", duplicate_of=original.id
+            )
+        else:
+            document = Document(filename=filename, storage_path=path, content_hash=digest, status="uploaded")
+        db.add(document)
+        db.flush()
+
+        originals.setdefault(digest, original or document)
+        documents.append(document)
+
+    queued = [d for d in documents if d.status == "uploaded"]
+    if queued:
+        # Acordar os workers (o NOTIFY é entregue no commit; um só aviso chega,
+        # porque cada worker continua a reservar documentos até a fila esvaziar)
+        notify_new_document(db, queued[0].id)
+
+    return [
+        {"document_id": d.id, "filename": d.filename, "status": d.status, "duplicate_of": d.duplicate_of}
+        for d in documents
+    ]
+
+
+def resolve_document_id(db: Session, document_id: int) -> int:
+    """Id do documento que tem os resultados (o original, se este for um duplicado)."""
+    duplicate_of = db.query(Document.duplicate_of).filter(Document.id == document_id).scalar()
+    return duplicate_of or document_id
@@ -0,0 +1,243 @@
+import os
+import select
+import socket
+import threading
+import time
+from datetime import timedelta
+
+import psycopg2
+from sqlalchemy import or_, and_, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.core.config import (
+    DATABASE_URL,
+    QUEUE_CHANNEL,
+    WORKER_LEASE_SECONDS,
+    WORKER_HEARTBEAT_SECONDS,
+    WORKER_MAX_ATTEMPTS,
+)
+from app.core.database import SessionLocal
+from app.models.document import Document
+
+
+class LeaseLost(Exception):
+    """O documento já não é deste worker (a lease expirou e outro worker reservou-o)."""
+
+
+def make_worker_id() -> str:
+    """Identificador único do worker (máquina + processo)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def notify_new_document(db: Session, document_id: int):
+    """
+    Avisa os workers que há trabalho novo.
+    O NOTIFY só é entregue quando a transação do upload fizer commit.
+    """
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": QUEUE_CHANNEL, "payload": str(document_id)}
+    )
+
+
+def lock_content_hash(db: Session, content_hash: str):
+    """
+    Advisory lock sobre um conteúdo (sha256) até ao fim da transação.
+    Serializa a deduplicação: dois uploads iguais em simultâneo não entram ambos
+    na fila, e um duplicado nunca fica ligado a um original que acabou de falhar.
+    """
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:hash))"), {"hash": content_hash})
+
+
+def release_duplicates(db: Session, document_id: int):
+    """
+    O original falhou: os uploads ligados a ele (duplicate_of) não podem ficar
+    em 'error' para sempre. O mais antigo volta à fila como original e os restantes
+    passam a apontar para ele. Sem commit. Devolve o id do novo original (ou None).
+    """
+    content_hash = db.query(Document.content_hash).filter(Document.id == document_id).scalar()
+    if content_hash:
+        lock_content_hash(db, content_hash)
+
+    duplicates = [
+        duplicate_id for (duplicate_id,) in db.query(Document.id)
+            .filter(Document.duplicate_of == document_id, Document.status == "duplicate")
+            .order_by(Document.id.asc())
+    ]
+    if not duplicates:
+        return None
+
+    new_original = duplicates[0]
+    db.query(Document)\
+        .filter(Document.id == new_original)\
+        .update({Document.status: "uploaded", Document.duplicate_of: None}, synchronize_session=False)
+    if len(duplicates) > 1:
+        db.query(Document)\
+            .filter(Document.id.in_(duplicates[1:]))\
+            .update({Document.duplicate_of: new_original}, synchronize_session=False)
+    notify_new_document(db, new_original)
+    return new_original
+
+
+def claim_next_document(db: Session, worker_id: str):
+    """
+    Reserva atomicamente o documento mais antigo disponível.
+    Usa FOR UPDATE SKIP LOCKED: vários workers podem correr em paralelo
+    sem nunca apanharem o mesmo documento.
+    Também recupera documentos 'processing' cuja lease expirou (worker morreu).
+    Devolve o id do documento ou None.
+    """
+    lease = timedelta(seconds=WORKER_LEASE_SECONDS)
+
+    document = db.query(Document)\
+        .filter(or_(
+            Document.status == "uploaded",
+            and_(Document.status == "processing", Document.lease_expires_at < func.now())
+        ))\
+        .order_by(Document.created_at.asc())\
+        .with_for_update(skip_locked=True)\
+        .first()
+
+    if not document:
+        db.rollback()
+        return None
+
+    # Documento que já fez cair demasiados workers: desistir dele
+    if (document.attempts or 0) >= WORKER_MAX_ATTEMPTS:
+        print(f"❌ Documento {document.id} excedeu {WORKER_MAX_ATTEMPTS} tentativas. Marcado como erro.")
+        document.status = "error"
+        document.locked_by = None
+        document.lease_expires_at = None
+        db.commit()
+        # Só depois de largar o FOR UPDATE do documento (um upload com o lock do conteúdo
+        # pode estar à espera dessa linha, pela chave estrangeira duplicate_of)
+        release_duplicates(db, document.id)
+        db.commit()
+        return claim_next_document(db, worker_id)
+
+    document.status = "processing"
+    document.locked_by = worker_id
+    document.lease_expires_at = func.now() + lease
+    document.attempts = (document.attempts or 0) + 1
+    db.commit()
+
+    return document.id
+
+
+def fenced_update(db: Session, document_id: int, worker_id: str, values: dict):
+    """
+    UPDATE do documento só se este worker ainda for o dono (fencing); sem commit.
+    Faz parte da transação de cada página: se a lease expirou e outro worker
+    reservou o documento, levanta LeaseLost e nada desta transação é gravado.
+    worker_id None = processamento direto, fora da fila (documento sem dono).
+    """
+    owner = Document.locked_by == worker_id if worker_id else Document.locked_by.is_(None)
+    updated = db.query(Document)\
+        .filter(Document.id == document_id, Document.status == "processing", owner)\
+        .update(values, synchronize_session=False)
+    if not updated:
+        raise LeaseLost(f"Documento {document_id} já não pertence a {worker_id}")
+
+
+def count_pending_documents(db: Session) -> int:
+    """Nº de documentos à espera na fila."""
+    return db.query(Document).filter(Document.status == "uploaded").count()
+
+
+def renew_lease(document_id: int, worker_id: str) -> bool:
+    """Prolonga a lease enquanto o worker ainda está a processar o documento."""
+    db = SessionLocal()
+    try:
+        updated = db.query(Document)\
+            .filter(
+                Document.id == document_id,
+                Document.locked_by == worker_id,
+                Document.status == "processing"
+            )\
+            .update(
+                {Document.lease_expires_at: func.now() + timedelta(seconds=WORKER_LEASE_SECONDS)},
+                synchronize_session=False
+            )
+        db.commit()
+        return updated > 0
+    finally:
+        db.close()
+
+
+class LeaseHeartbeat:
+    """
+    Renova a lease de um documento numa thread de fundo.
+    Uso:
+        with LeaseHeartbeat(document_id, worker_id):
+            process_document(document_id)
+    """
+    def __init__(self, document_id: int, worker_id: str, interval: int = WORKER_HEARTBEAT_SECONDS):
+        self.document_id = document_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not renew_lease(self.document_id, self.worker_id):
+                    return  # Documento terminado ou lease perdida
+            except Exception as e:
+                print(f"⚠️ Erro ao renovar lease do documento {self.document_id}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+class QueueListener:
+    """
+    Ligação dedicada ao Postgres que fica em LISTEN no canal da fila.
+    Se a ligação cair (ex: Postgres reiniciado), volta a ligar-se na espera seguinte.
+    """
+    def __init__(self, dsn: str = DATABASE_URL, channel: str = QUEUE_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.conn = None
+        self._connect()
+
+    def _connect(self):
+        self.conn = psycopg2.connect(self.dsn)
+        self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel};")
+
+    def wait(self, timeout: float) -> bool:
+        """Bloqueia até chegar um NOTIFY ou passar o timeout. Devolve True se houve aviso."""
+        try:
+            if self.conn is None:
+                self._connect()
+            if not self.conn.notifies:
+                ready, _, _ = select.select([self.conn], [], [], timeout)
+                if ready:
+                    self.conn.poll()
+        except (psycopg2.Error, OSError) as e:
+            # Ligação perdida: o worker continua (volta a procurar trabalho pela BD)
+            # e a próxima espera tenta ligar-se de novo
+            print(f"⚠️ Ligação do LISTEN perdida: {e}")
+            self.close()
+            time.sleep(min(timeout, 5))
+            return False
+        got_notification = bool(self.conn.notifies)
+        self.conn.notifies.clear()
+        return got_notification
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
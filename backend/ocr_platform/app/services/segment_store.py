@@ -0,0 +1,79 @@
+import fcntl
+import os
+
+import cv2
+
+from app.core.config import SEGMENT_IMAGE_FORMAT
+
+SEGMENTS_DIR = "segments"
+
+# Nº de subpastas: os pacotes ficam espalhados em segments/00 ... segments/ff
+PACK_SHARDS = 256
+
+ENCODE_PARAMS = {
+    "png": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 3]),
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 101]),  # > 100 = WebP sem perdas
+}
+
+
+def pack_path(document_id: int) -> str:
+    """
+    Um só ficheiro (append-only) por documento com todos os recortes:
+    segments/<shard>/<document_id>.pack
+    O índice (offset e tamanho de cada recorte) fica na tabela ocr_segmentos.
+    """
+    return os.path.join(SEGMENTS_DIR, f"{document_id % PACK_SHARDS:02x}", f"{document_id}.pack")
+
+
+def encode_crop(image, fmt: str = SEGMENT_IMAGE_FORMAT) -> bytes:
+    ext, params = ENCODE_PARAMS[fmt]
+    ok, encoded = cv2.imencode(ext, image, params)
+    if not ok:
+        raise ValueError(f"Não foi possível codificar o recorte em {fmt}")
+    return encoded.tobytes()
+
+
+def media_type(data: bytes) -> str:
+    """Tipo MIME pelos primeiros bytes (o pacote pode misturar PNG e WebP)."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+class SegmentPack:
+    """
+    Pacote de recortes de um documento.
+    append_many acrescenta recortes no fim e devolve (offset, tamanho) de cada um.
+    O pacote nunca é cortado: se a lease expirar, outro worker pode já estar a escrever
+    no mesmo ficheiro. Os bytes de uma página falhada ficam órfãos (nenhuma linha de
+    ocr_segmentos aponta para eles); só os offsets gravados no commit contam.
+    A escrita é feita sob flock, para que os offsets não se misturem com os de outro worker.
+    """
+    def __init__(self, document_id: int):
+        self.path = pack_path(document_id)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def append_many(self, blobs) -> list:
+        locations = []
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                for data in blobs:
+                    f.write(data)
+                    locations.append((offset, len(data)))
+                    offset += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return locations
+
+
+def read_crop(path: str, offset: int = None, length: int = None) -> bytes:
+    """Lê um recorte: do pacote (offset/tamanho) ou, nos segmentos antigos, o PNG inteiro."""
+    with open(path, "rb") as f:
+        if offset is None:
+            return f.read()
+        f.seek(offset)
+        return f.read(length)
@@ -1,20 +1,112 @@
-import shutil
+import hashlib
 import os
 import uuid
+import anyio
 from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from app.core.config import MAX_UPLOAD_BYTES
 
 UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-def save_file(file: UploadFile) -> str:
-    # Gerar um nome seguro se o filename vier vazio
-    filename = file.filename if file.filename else f"doc_{uuid.uuid4()}.pdf"
-    
-    # Criar caminho completo
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    # Guardar o ficheiro
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    return file_path
\ No newline at end of file
+TMP_DIR = os.path.join(UPLOAD_DIR, "tmp")
+os.makedirs(TMP_DIR, exist_ok=True)
+
+# Os ficheiros são lidos e gravados aos bocados (nunca inteiros em memória)
+CHUNK_SIZE = 1024 * 1024
+
+ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg"}
+CONTENT_TYPE_EXTENSIONS = {"application/pdf": ".pdf", "image/png": ".png", "image/jpeg": ".jpg"}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def file_extension(filename: str, content_type: str = None) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in ALLOWED_EXTENSIONS:
+        return ext
+    return CONTENT_TYPE_EXTENSIONS.get(content_type, ".bin")
+
+
+def content_path(digest: str, ext: str) -> str:
+    """
+    Caminho endereçado pelo conteúdo: uploads/ab/cd/<sha256>.pdf
+    Dois ficheiros com o mesmo nome nunca se sobrepõem, e o mesmo conteúdo
+    é guardado uma só vez.
+    """
+    return os.path.join(UPLOAD_DIR, digest[:2], digest[2:4], digest + ext)
+
+
+def _new_tmp_path() -> str:
+    return os.path.join(TMP_DIR, f"{uuid.uuid4().hex}.part")
+
+
+def _finalize(tmp_path: str, digest: str, ext: str) -> str:
+    """Move o ficheiro temporário para o caminho final (ou descarta-o se já existir)."""
+    final_path = content_path(digest, ext)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, final_path)
+    return final_path
+
+
+async def save_upload_to_tmp(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Grava um upload num ficheiro temporário sem bloquear o event loop:
+    lê aos bocados e calcula o SHA-256 pelo caminho.
+    Devolve (caminho_temporário, sha256, tamanho). Lança UploadTooLarge acima de max_bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = _new_tmp_path()
+
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as buffer:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{file.filename} excede {max_bytes} bytes")
+                digest.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return tmp_path, digest.hexdigest(), size
+
+
+async def save_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """Grava um upload no caminho endereçado pelo conteúdo. Devolve (caminho, sha256, tamanho)."""
+    tmp_path, digest, size = await save_upload_to_tmp(file, max_bytes)
+    ext = file_extension(file.filename, file.content_type)
+    path = await run_in_threadpool(_finalize, tmp_path, digest, ext)
+    return path, digest, size
+
+
+def save_stream(stream, filename: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Versão síncrona do save_upload para ficheiros já abertos (ex: entradas de um zip).
+    Deve correr numa thread, nunca diretamente no event loop.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = _new_tmp_path()
+
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while chunk := stream.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{filename} excede {max_bytes} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    path = _finalize(tmp_path, digest.hexdigest(), file_extension(filename))
+    return path, digest.hexdigest(), size
@@ -1,3 +1,6 @@
+import glob
+import os
+from sqlalchemy import text
 from app.core.database import engine
 from app.models.base import Base
 # Importar todos os modelos para o SQLAlchemy os reconhecer
@@ -5,7 +8,19 @@ from app.models.document import Document
 from app.models.ocr import OCRResultado
 from app.models.segment import OCRSegmento
 from app.models.correction import CorrecaoHumana
+from app.models.line_cache import OCRCacheLinha
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
 
 print("A criar tabelas na base de dados...")
 Base.metadata.create_all(bind=engine)
-print("Tabelas criadas com sucesso!")
\ No newline at end of file
+print("Tabelas criadas com sucesso!")
+
+# As migrações são SQL idempotente (IF NOT EXISTS), por isso podem correr sempre
+print("A aplicar migrações...")
+with engine.begin() as conn:
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        with open(path, encoding="utf-8") as f:
+            conn.execute(text(f.read()))
+        print(f"   -> {os.path.basename(path)}")
+print("Migrações aplicadas com sucesso!")
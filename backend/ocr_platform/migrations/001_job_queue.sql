@@ -0,0 +1,4 @@
+-- Fila de trabalho: leases para vários workers em paralelo
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS locked_by VARCHAR;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0;
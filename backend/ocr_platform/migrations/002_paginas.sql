@@ -0,0 +1,5 @@
+-- Processamento página a página (PDFs multi-página)
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS num_paginas INTEGER;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS paginas_processadas INTEGER DEFAULT 0;
+ALTER TABLE ocr_resultados ADD COLUMN IF NOT EXISTS pagina INTEGER DEFAULT 1;
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS pagina INTEGER DEFAULT 1;
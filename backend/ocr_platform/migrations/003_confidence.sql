@@ -0,0 +1,2 @@
+-- Confiança real do OCR ao nível do documento
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS confidence_global DOUBLE PRECISION;
@@ -0,0 +1,2 @@
+-- Versão do modelo que produziu cada resultado
+ALTER TABLE ocr_resultados ADD COLUMN IF NOT EXISTS model_version VARCHAR;
@@ -0,0 +1,6 @@
+-- Posição de cada segmento na página (para juntar pedaços de linha)
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS linha INTEGER;
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS bbox_x INTEGER;
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS bbox_y INTEGER;
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS bbox_w INTEGER;
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS bbox_h INTEGER;
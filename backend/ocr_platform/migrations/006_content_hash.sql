@@ -0,0 +1,2 @@
+-- SHA-256 do ficheiro enviado (uploads endereçados pelo conteúdo)
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
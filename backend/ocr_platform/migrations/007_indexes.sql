@@ -0,0 +1,5 @@
+-- Índices em falta (chaves estrangeiras e a consulta da fila do worker)
+CREATE INDEX IF NOT EXISTS ix_ocr_resultados_document_id ON ocr_resultados (document_id);
+CREATE INDEX IF NOT EXISTS ix_ocr_segmentos_ocr_resultado_id ON ocr_segmentos (ocr_resultado_id);
+CREATE INDEX IF NOT EXISTS ix_correcoes_humanas_segmento_id ON correcoes_humanas (segmento_id);
+CREATE INDEX IF NOT EXISTS ix_documents_status_created_at ON documents (status, created_at);
@@ -0,0 +1,4 @@
+-- Recortes guardados num pacote por documento: posição e tamanho dentro do ficheiro
+-- (NULL = segmento antigo, um PNG inteiro em imagem_path)
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS imagem_offset BIGINT;
+ALTER TABLE ocr_segmentos ADD COLUMN IF NOT EXISTS imagem_tamanho INTEGER;
@@ -0,0 +1,14 @@
+-- Uma só correção por segmento (as novas fazem upsert), com a data da última alteração
+-- (sem default ao criar a coluna, para as correções antigas ficarem com a data em que foram feitas)
+ALTER TABLE correcoes_humanas ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+UPDATE correcoes_humanas SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE correcoes_humanas ALTER COLUMN updated_at SET DEFAULT now();
+
+-- Manter só a correção mais recente de cada segmento
+DELETE FROM correcoes_humanas older
+    USING correcoes_humanas newer
+    WHERE older.segmento_id = newer.segmento_id AND older.id < newer.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_correcoes_humanas_segmento_id ON correcoes_humanas (segmento_id);
+-- O índice simples da 007 fica redundante com o único
+DROP INDEX IF EXISTS ix_correcoes_humanas_segmento_id;
@@ -0,0 +1,3 @@
+-- Uploads repetidos (mesmo conteúdo) ficam ligados ao documento original
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS duplicate_of INTEGER REFERENCES documents(id);
+CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash);
@@ -0,0 +1,222 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+
+from ml.benchmark.synthetic import generate_corpus
+from ml.preprocessing.image import (
+    count_pages, render_page, normalize_background, remove_lines_and_borders,
+    ensure_horizontal_orientation, correct_small_skew, segment_lines
+)
+
+CORPUS_DIR = "data/benchmark"
+
+# Etapas medidas (pela ordem do pipeline)
+STAGES = [
+    "load_image_or_pdf", "normalize_background", "remove_lines_and_borders",
+    "ensure_horizontal_orientation", "correct_small_skew", "segment_lines",
+]
+
+
+class StageTimer:
+    """Acumula durações (segundos) por etapa."""
+    def __init__(self):
+        self.durations = {}
+
+    def measure(self, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.durations.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        return {
+            stage: {
+                "count": len(values),
+                "total": float(np.sum(values)),
+                "mean": float(np.mean(values)),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+            }
+            for stage, values in self.durations.items()
+        }
+
+
+def benchmark_preprocessing(corpus, timer: StageTimer):
+    """Mede cada etapa de ml/preprocessing/image.py, página a página. Devolve as linhas."""
+    all_lines = []
+    for item in corpus:
+        for page_number in range(1, count_pages(item["path"]) + 1):
+            img = timer.measure("load_image_or_pdf", render_page, item["path"], page_number)
+            binary, _ = timer.measure("normalize_background", normalize_background, img)
+            clean = timer.measure("remove_lines_and_borders", remove_lines_and_borders, binary)
+            clean, img = timer.measure("ensure_horizontal_orientation", ensure_horizontal_orientation, clean, img)
+            img, clean = timer.measure("correct_small_skew", correct_small_skew, img, clean)
+            lines = timer.measure("segment_lines", segment_lines, clean)
+            all_lines.append(lines)
+    return all_lines
+
+
+def benchmark_inference(pages_lines, timer: StageTimer):
+    """Mede a inferência TrOCR (em lotes) de cada página."""
+    from ml.inference.trocr import get_model, run_trocr_batch
+
+    loaded = timer.measure("model_load", get_model)
+    total_lines = 0
+    start = time.perf_counter()
+    for lines in pages_lines:
+        if lines:
+            timer.measure("inference_page", run_trocr_batch, lines, loaded=loaded)
+            total_lines += len(lines)
+    elapsed = time.perf_counter() - start
+    return {
+        "model_version": loaded.version,
+        "lines": total_lines,
+        "lines_per_second": total_lines / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def benchmark_end_to_end(corpus, timer: StageTimer):
+    """
+    Corre o pipeline completo do worker contra a BD local (cria um Document por ficheiro):
+    todos os documentos num só process_documents, com o pool de pré-processamento,
+    como no worker (o documento seguinte é preparado durante a inferência do atual).
+    Falha se algum documento não terminar em 'ocr_completed'.
+    A cache de linhas fica desligada: com a mesma seed, as corridas seguintes leriam
+    quase tudo da cache e não seriam comparáveis com a baseline.
+    Não usar contra a BD de produção!
+    """
+    from app.core.config import INFERENCE_SOCKET
+    from app.core.database import SessionFactory
+    from app.models.document import Document
+    from ml.inference.trocr import line_cache
+    from workers.ocr_worker import process_documents
+    from workers.pipeline import create_preprocess_pool
+
+    if INFERENCE_SOCKET:
+        print("⚠️ INFERENCE_SOCKET definido: a cache do servidor de inferência não é desligada "
+              "(para medir sem cache, corra sem INFERENCE_SOCKET).")
+
+    db = SessionFactory()
+    try:
+        documents = [
+            Document(filename=os.path.basename(item["path"]), storage_path=item["path"], status="benchmark")
+            for item in corpus
+        ]
+        db.add_all(documents)
+        db.commit()
+        document_ids = [document.id for document in documents]
+    finally:
+        db.close()
+
+    pool = create_preprocess_pool()
+    try:
+        with line_cache.disabled():
+            timer.measure("process_documents", process_documents, document_ids, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    db = SessionFactory()
+    try:
+        statuses = dict(db.query(Document.id, Document.status).filter(Document.id.in_(document_ids)))
+    finally:
+        db.close()
+    failed = [document_id for document_id in document_ids if statuses.get(document_id) != "ocr_completed"]
+    for document_id in failed:
+        print(f"❌ Documento {document_id} terminou em '{statuses.get(document_id)}'.")
+
+    pages = sum(item["pages"] for item in corpus)
+    total = sum(timer.durations.get("process_documents", []))
+    return {
+        "documents": len(corpus), "pages": pages, "failed": failed,
+        "pages_per_second": pages / total if total > 0 else 0.0,
+    }
+
+
+def compare_with_baseline(report, baseline, tolerance: float):
+    """Lista as etapas cuja média piorou mais do que 'tolerance' (ex: 0.2 = 20%)."""
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or previous["mean"] <= 0:
+            continue
+        change = current["mean"] / previous["mean"] - 1
+        if change > tolerance:
+            regressions.append({"stage": stage, "baseline": previous["mean"], "current": current["mean"], "change": change})
+    return regressions
+
+
+def run(args):
+    print(f"🧪 A gerar documentos sintéticos em '{args.corpus_dir}'...")
+    corpus = generate_corpus(
+        args.corpus_dir, num_images=args.images, num_pdfs=args.pdfs,
+        pages_per_pdf=args.pages_per_pdf, seed=args.seed
+    )
+
+    timer = StageTimer()
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "corpus": {"documents": len(corpus), "pages": sum(item["pages"] for item in corpus), "seed": args.seed},
+    }
+
+    print("⏱️ A medir o pré-processamento...")
+    pages_lines = benchmark_preprocessing(corpus, timer)
+    report["corpus"]["lines"] = sum(len(lines) for lines in pages_lines)
+
+    if args.inference:
+        print("⏱️ A medir a inferência...")
+        report["inference"] = benchmark_inference(pages_lines, timer)
+
+    if args.db:
+        print("⏱️ A medir o pipeline completo do worker (BD local)...")
+        report["end_to_end"] = benchmark_end_to_end(corpus, timer)
+
+    report["stages"] = timer.summary()
+
+    for stage, stats in report["stages"].items():
+        print(f"   {stage:<32} média {1000 * stats['mean']:8.1f} ms | p95 {1000 * stats['p95']:8.1f} ms")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare_with_baseline(report, baseline, args.tolerance)
+        for r in report["regressions"]:
+            print(f"❌ Regressão em {r['stage']}: {r['change']:+.0%}")
+        if not report["regressions"]:
+            print("✅ Sem regressões face à baseline.")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Relatório guardado em '{args.output}'")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline OCR com documentos sintéticos.")
+    parser.add_argument("--corpus-dir", default=CORPUS_DIR)
+    parser.add_argument("--images", type=int, default=4, help="Nº de imagens soltas")
+    parser.add_argument("--pdfs", type=int, default=2, help="Nº de PDFs multi-página")
+    parser.add_argument("--pages-per-pdf", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--inference", action="store_true", help="Medir também a inferência TrOCR")
+    parser.add_argument("--db", action="store_true", help="Medir também o pipeline completo do worker (BD local)")
+    parser.add_argument("--output", help="Guardar o relatório em JSON neste ficheiro")
+    parser.add_argument("--baseline", help="Relatório JSON anterior para detetar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Piora máxima aceite por etapa (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = run(args)
+    failed = report.get("end_to_end", {}).get("failed")
+    sys.exit(1 if report.get("regressions") or failed else 0)
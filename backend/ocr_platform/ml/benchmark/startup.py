@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import argparse
+import json
+import subprocess
+import time
+
+import numpy as np
+
+
+def measure_startup(model_path: str = None, backend: str = "pytorch") -> dict:
+    """
+    Um arranque a frio (corre num processo novo): tempo até importar as bibliotecas,
+    carregar o modelo e ler a primeira linha.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    import torch
+    timings["import_torch"] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    from ml.inference.trocr import load_model, warm_up
+    from ml.inference.registry import LoadedModel
+    timings["import_inference"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    processor, model = load_model(backend, model_path)
+    timings["load_model"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    warm_up(LoadedModel("startup", processor, model))
+    timings["first_line"] = time.perf_counter() - mark
+
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def run(model_path: str = None, backend: str = "pytorch", repeats: int = 3, offline: bool = False) -> dict:
+    """Mede 'repeats' arranques a frio, cada um num processo Python novo."""
+    env = dict(os.environ)
+    if offline:
+        env["MODEL_OFFLINE"] = "true"
+
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--backend", backend]
+    if model_path:
+        command += ["--model-path", model_path]
+
+    runs = []
+    for i in range(repeats):
+        print(f"⏱️ Arranque a frio {i + 1}/{repeats}...")
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        # A última linha do processo filho é o JSON com os tempos
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    summary = {
+        stage: {"mean": float(np.mean([r[stage] for r in runs])), "p50": float(np.median([r[stage] for r in runs]))}
+        for stage in runs[0]
+    }
+    for stage, stats in summary.items():
+        print(f"   {stage:<18} média {stats['mean']:7.2f} s | p50 {stats['p50']:7.2f} s")
+
+    return {"model_path": model_path, "backend": backend, "offline": offline, "runs": runs, "summary": summary}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede o tempo de arranque a frio do modelo (import + carga + 1ª linha).")
+    parser.add_argument("--model-path", help="Pasta do modelo/bundle (por omissão: versão promovida)")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--offline", action="store_true", help="Arrancar com MODEL_OFFLINE (sem Hub)")
+    parser.add_argument("--output", help="Guardar o relatório em JSON neste ficheiro")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_startup(args.model_path, args.backend)))
+        sys.exit(0)
+
+    report = run(args.model_path, args.backend, args.repeats, args.offline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Relatório guardado em '{args.output}'")
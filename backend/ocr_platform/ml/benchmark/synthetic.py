@@ -0,0 +1,122 @@
+import os
+import random
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+# Vocabulário típico dos registos (nomes, locais, termos do registo civil)
+WORDS = [
+    "Nome", "Luanda", "Benguela", "Huambo", "Malanje", "Cabinda", "nascido", "filho",
+    "de", "e", "aos", "dias", "do", "mes", "ano", "registo", "assento", "Maria",
+    "Joaquim", "Domingos", "Antonio", "Teresa", "Manuel", "Francisca", "bairro",
+    "Rua", "Provincia", "Municipio", "solteiro", "casado", "pai", "mae", "testemunha",
+]
+
+# Fontes "manuscritas" do OpenCV (não precisam de ficheiros de fontes)
+FONTS = [cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, cv2.FONT_HERSHEY_SCRIPT_COMPLEX]
+
+# A4 a ~150 dpi (o mesmo tamanho que o zoom 2x do PyMuPDF dá para um A4)
+PAGE_SIZE = (1190, 1684)
+
+
+def random_sentence(rng: random.Random, min_words=3, max_words=8) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def paper_background(rng: random.Random, width: int, height: int) -> np.ndarray:
+    """Papel amarelado com gradiente de iluminação e grão."""
+    base = np.array([rng.randint(200, 235), rng.randint(225, 245), rng.randint(235, 252)], np.float32)
+    # Gradiente suave (iluminação irregular do scanner)
+    gradient = np.linspace(rng.uniform(-25, 0), rng.uniform(0, 10), width, dtype=np.float32)
+    page = np.tile(base, (height, width, 1)) + gradient[None, :, None]
+    # Grão do papel
+    np_rng = np.random.default_rng(rng.randint(0, 2**31))
+    page += np_rng.normal(0, 6, page.shape).astype(np.float32)
+    return np.clip(page, 0, 255).astype(np.uint8)
+
+
+def render_page(rng: random.Random, size=PAGE_SIZE, ruled=True, skew=0.0, rotate_90=False):
+    """
+    Gera uma página sintética "digitalizada" (BGR) e o texto de cada linha.
+    skew: inclinação em graus; rotate_90: página deitada.
+    """
+    width, height = size
+    page = paper_background(rng, width, height)
+    line_height = rng.randint(55, 75)
+    margin = 90
+    ink = (rng.randint(60, 110), rng.randint(30, 60), rng.randint(10, 40))  # Tinta azul/preta
+
+    texts = []
+    y = margin + line_height
+    while y < height - margin:
+        if ruled:
+            cv2.line(page, (margin // 2, y + 8), (width - margin // 2, y + 8), (200, 170, 150), 1)
+
+        text = random_sentence(rng)
+        font = rng.choice(FONTS)
+        scale = rng.uniform(1.1, 1.5)
+        x = margin + rng.randint(0, 40)
+        cv2.putText(page, text, (x, y), font, scale, ink, rng.randint(1, 2), cv2.LINE_AA)
+        texts.append(text)
+        y += line_height
+
+    # Moldura escura nas bordas (ruído típico de digitalização)
+    cv2.rectangle(page, (0, 0), (width - 1, height - 1), (40, 40, 40), 12)
+
+    if skew:
+        M = cv2.getRotationMatrix2D((width // 2, height // 2), skew, 1.0)
+        page = cv2.warpAffine(page, M, (width, height), borderMode=cv2.BORDER_REPLICATE)
+    if rotate_90:
+        page = cv2.rotate(page, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+    return page, texts
+
+
+def write_pdf(pages, path: str):
+    """Grava várias páginas (BGR) num PDF. Ao renderizar com zoom 2x, volta ao tamanho original."""
+    doc = fitz.open()
+    for page in pages:
+        h, w = page.shape[:2]
+        ok, png = cv2.imencode(".png", page)
+        pdf_page = doc.new_page(width=w / 2, height=h / 2)
+        pdf_page.insert_image(pdf_page.rect, stream=png.tobytes())
+    doc.save(path)
+    doc.close()
+
+
+def generate_corpus(output_dir: str, num_images=4, num_pdfs=2, pages_per_pdf=5, seed=42):
+    """
+    Gera um conjunto reprodutível de documentos sintéticos:
+    imagens soltas (com e sem inclinação/rotação) e PDFs multi-página.
+    Devolve a lista de {"path", "pages", "texts"}.
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    corpus = []
+
+    def random_page():
+        return render_page(
+            rng,
+            ruled=rng.random() < 0.7,
+            skew=rng.uniform(-4, 4) if rng.random() < 0.6 else 0.0,
+            rotate_90=rng.random() < 0.15,
+        )
+
+    for i in range(num_images):
+        page, texts = random_page()
+        path = os.path.join(output_dir, f"synthetic_{i:03d}.png")
+        cv2.imwrite(path, page)
+        corpus.append({"path": path, "pages": 1, "texts": texts})
+
+    for i in range(num_pdfs):
+        pages, texts = [], []
+        for _ in range(pages_per_pdf):
+            page, page_texts = random_page()
+            pages.append(page)
+            texts.extend(page_texts)
+        path = os.path.join(output_dir, f"synthetic_{i:03d}.pdf")
+        write_pdf(pages, path)
+        corpus.append({"path": path, "pages": pages_per_pdf, "texts": texts})
+
+    return corpus
@@ -0,0 +1,36 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import argparse
+import json
+
+from ml.inference.backends import BACKENDS
+from ml.inference.trocr import BATCH_SIZE
+from ml.evaluation.evaluete import compare, DATASET_DIR
+
+
+def benchmark(backends, dataset_dir=DATASET_DIR, batch_size=BATCH_SIZE):
+    """
+    Compara backends contra o fp32 (pytorch): latência, débito e
+    desvio de CER (accuracy perdida pela otimização).
+    Atalho para o evaluete.compare com a versão promovida em cada backend.
+    """
+    # O fp32 é sempre a referência (o primeiro da lista)
+    backends = ["pytorch"] + [backend for backend in backends if backend != "pytorch"]
+    return compare(backends, dataset_dir, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara backends de inferência do TrOCR.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--output", help="Guardar o relatório em JSON neste ficheiro")
+    args = parser.parse_args()
+
+    report = benchmark(args.backends, args.dataset, args.batch_size)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Relatório guardado em '{args.output}'")
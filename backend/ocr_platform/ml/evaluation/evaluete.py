@@ -1,5 +1,177 @@
-from jiwer import wer
+import sys
+import os
+sys.path.append(os.getcwd())
+import argparse
+import csv
+import json
+import time
+
+import numpy as np
+from PIL import Image
+from jiwer import cer, wer
+
+from ml.inference.backends import BACKENDS
+from ml.inference.registry import VERSIONS_DIR, BASE_MODEL
+from ml.inference.trocr import load_model, decode_images, BATCH_SIZE, DECODING_STRATEGY
+
+DATASET_DIR = "data/dataset_v1"
+
 
 def evaluate(predictions, references):
-    error = wer(references, predictions)
-    print(f"Word Error Rate: {error}")
+    """CER e WER de uma lista de previsões contra as referências."""
+    result = {"cer": cer(references, predictions), "wer": wer(references, predictions)}
+    print(f"Character Error Rate: {result['cer']:.4f} | Word Error Rate: {result['wer']:.4f}")
+    return result
+
+
+def load_test_split(dataset_dir=DATASET_DIR, types_csv=None):
+    """
+    Lê o test.csv e devolve (imagens PIL, textos de referência, tipo de documento de cada linha).
+    O tipo vem da coluna 'doc_type' do test.csv ou de um CSV à parte (file_name, doc_type);
+    sem nenhum dos dois, todas as linhas ficam no tipo 'todos'.
+    """
+    images_dir = os.path.join(dataset_dir, "images")
+    with open(os.path.join(dataset_dir, "test.csv"), newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f) if row["file_name"] and row["text"]]
+
+    types = {}
+    if types_csv:
+        with open(types_csv, newline="", encoding="utf-8") as f:
+            types = {row["file_name"]: row["doc_type"] for row in csv.DictReader(f)}
+
+    images = [Image.open(os.path.join(images_dir, row["file_name"])).convert("RGB") for row in rows]
+    references = [row["text"] for row in rows]
+    doc_types = [row.get("doc_type") or types.get(row["file_name"], "todos") for row in rows]
+    return images, references, doc_types
+
+
+def parse_model(spec: str):
+    """
+    'backend' ou 'backend:versão' (ex: int8, pytorch:v20250101_120000, pytorch:base).
+    Sem versão = a promovida.
+    """
+    backend, _, version = spec.partition(":")
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de inferência desconhecido: {backend} (opções: {', '.join(BACKENDS)})")
+    if not version:
+        return backend, None
+    if version == "base":
+        return backend, BASE_MODEL
+    return backend, os.path.join(VERSIONS_DIR, version)
+
+
+def run_model(spec: str, images, batch_size=BATCH_SIZE, strategy=DECODING_STRATEGY):
+    """
+    Decodifica o test split em lotes com um modelo/backend e mede débito e latências.
+    A latência de uma linha é a do lote onde vai (só tem o texto quando o lote acaba);
+    o custo amortizado por linha (tempo do lote / nº de linhas) é outra coisa e vem à parte.
+    """
+    backend, model_path = parse_model(spec)
+    processor, model = load_model(backend, model_path)
+
+    # Aquecimento: o primeiro lote paga compilação / alocação de memória
+    decode_images(images[:batch_size], processor, model, strategy)
+
+    predictions = []
+    batch_latencies, line_latencies, line_costs = [], [], []
+    start_total = time.perf_counter()
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        start_batch = time.perf_counter()
+        predictions.extend(text for text, _ in decode_images(batch, processor, model, strategy))
+        elapsed = time.perf_counter() - start_batch
+        batch_latencies.append(elapsed)
+        line_latencies.extend([elapsed] * len(batch))
+        line_costs.append(elapsed / len(batch))
+    total = time.perf_counter() - start_total
+
+    return predictions, {
+        "total_seconds": total,
+        "lines_per_second": len(images) / total if total > 0 else 0.0,
+        "batch_latency_p50_ms": 1000 * float(np.percentile(batch_latencies, 50)),
+        "batch_latency_p95_ms": 1000 * float(np.percentile(batch_latencies, 95)),
+        "line_latency_p50_ms": 1000 * float(np.percentile(line_latencies, 50)),
+        "line_latency_p95_ms": 1000 * float(np.percentile(line_latencies, 95)),
+        "amortized_line_ms": 1000 * float(np.mean(line_costs)),
+    }
+
+
+def score(predictions, references, doc_types):
+    """CER/WER no total e por tipo de documento."""
+    result = {"cer": cer(references, predictions), "wer": wer(references, predictions), "by_type": {}}
+    for doc_type in sorted(set(doc_types)):
+        idx = [i for i, t in enumerate(doc_types) if t == doc_type]
+        refs = [references[i] for i in idx]
+        preds = [predictions[i] for i in idx]
+        result["by_type"][doc_type] = {"lines": len(idx), "cer": cer(refs, preds), "wer": wer(refs, preds)}
+    return result
+
+
+def compare(models, dataset_dir=DATASET_DIR, batch_size=BATCH_SIZE, strategy=DECODING_STRATEGY, types_csv=None):
+    """
+    Avalia um ou mais modelos (versões e/ou backends) no mesmo test split.
+    O primeiro é a referência: os seguintes mostram a diferença de CER/WER e o speedup.
+    """
+    images, references, doc_types = load_test_split(dataset_dir, types_csv)
+    if not images:
+        print("⚠️ O test.csv está vazio! Corre o build_dataset.py primeiro.")
+        return {}
+
+    print(f"📚 {len(images)} linhas de teste.")
+    report = {
+        "dataset": dataset_dir, "lines": len(images), "batch_size": batch_size,
+        "strategy": strategy, "models": {},
+    }
+    baseline = None
+
+    for spec in models:
+        print(f"⏱️ A avaliar '{spec}'...")
+        predictions, timing = run_model(spec, images, batch_size, strategy)
+        result = dict(score(predictions, references, doc_types), **timing)
+
+        if baseline is None:
+            baseline = dict(result, predictions=predictions)
+        result["cer_delta"] = result["cer"] - baseline["cer"]
+        result["wer_delta"] = result["wer"] - baseline["wer"]
+        result["speedup"] = baseline["total_seconds"] / timing["total_seconds"] if timing["total_seconds"] > 0 else 0.0
+        result["changed_lines"] = sum(p != b for p, b in zip(predictions, baseline["predictions"]))
+        report["models"][spec] = result
+
+        print(f"   -> CER {result['cer']:.4f} ({result['cer_delta']:+.4f}) | WER {result['wer']:.4f} "
+              f"({result['wer_delta']:+.4f}) | {result['lines_per_second']:.2f} linhas/s | "
+              f"latência p50 {result['line_latency_p50_ms']:.1f} ms | p95 {result['line_latency_p95_ms']:.1f} ms | "
+              f"{result['amortized_line_ms']:.1f} ms/linha amortizado")
+        for doc_type, stats in result["by_type"].items():
+            print(f"      {doc_type:<20} {stats['lines']:>6} linhas | CER {stats['cer']:.4f} | WER {stats['wer']:.4f}")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Avalia (e compara) modelos TrOCR no test.csv: CER/WER, débito e latência.")
+    parser.add_argument("--models", nargs="+", default=["pytorch"],
+                        help="backend ou backend:versão; o primeiro é a referência (ex: pytorch pytorch:v20250101_120000)")
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--strategy", default=DECODING_STRATEGY)
+    parser.add_argument("--types", help="CSV (file_name, doc_type) com o tipo de documento de cada linha")
+    parser.add_argument("--max-cer-increase", type=float,
+                        help="Falhar (exit 1) se algum modelo tiver CER acima da referência + este valor")
+    parser.add_argument("--output", help="Guardar o relatório em JSON neste ficheiro")
+    args = parser.parse_args()
+
+    report = compare(args.models, args.dataset, args.batch_size, args.strategy, args.types)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Relatório guardado em '{args.output}'")
+
+    if args.max_cer_increase is not None:
+        worse = [
+            spec for spec, result in report.get("models", {}).items()
+            if result["cer_delta"] > args.max_cer_increase
+        ]
+        for spec in worse:
+            print(f"❌ '{spec}' piorou o CER acima do limite ({args.max_cer_increase}).")
+        sys.exit(1 if worse else 0)
@@ -0,0 +1,153 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from ml.preprocessing.image import (
+    iter_pages, preprocess_page, find_line_spans, estimate_skew_angle,
+    normalize_background, remove_lines_and_borders, ensure_horizontal_orientation, FAST_SCALE
+)
+
+
+def page_decisions(img, scale: float):
+    """
+    Decisões geométricas de um perfil, pela mesma ordem do preprocess_page:
+    se a página foi rodada 90º e quanto foi corrigido de inclinação (0 se nada).
+    """
+    binary, _ = normalize_background(img, scale)
+    clean = remove_lines_and_borders(binary)
+    rotated, _ = ensure_horizontal_orientation(clean, img)
+    angle = estimate_skew_angle(rotated, scale)
+    applied = angle if angle is not None and 0.5 < abs(angle) < 10 else 0.0
+    return {"rotated": rotated.shape != clean.shape, "skew": angle, "skew_applied": applied}
+
+
+def line_boxes(clean) -> list:
+    """Caixa (x0, y0, x1, y1) da tinta de cada linha detetada."""
+    boxes = []
+    for y0, y1, _ in find_line_spans(clean):
+        ink_columns = np.flatnonzero(np.count_nonzero(clean[y0:y1], axis=0))
+        if len(ink_columns):
+            boxes.append((int(ink_columns[0]), int(y0), int(ink_columns[-1]) + 1, int(y1)))
+    return boxes
+
+
+def box_iou(a, b) -> float:
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 1.0
+
+
+def compare_page(img, skew_tolerance: float, min_box_iou: float):
+    """
+    Corre os perfis 'exact' e 'fast' na mesma página e compara o que importa para o OCR:
+    a mesma orientação, a mesma correção de inclinação (a menos de skew_tolerance graus)
+    e as mesmas linhas (quantidade e caixas com IoU >= min_box_iou).
+    Não se comparam píxeis: uma diferença de centésimas de grau na rotação
+    desloca todos os píxeis sem mudar o resultado.
+    """
+    start = time.perf_counter()
+    exact = preprocess_page(img.copy(), "exact")
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = preprocess_page(img.copy(), "fast")
+    fast_seconds = time.perf_counter() - start
+
+    decisions_exact = page_decisions(img, 1.0)
+    decisions_fast = page_decisions(img, FAST_SCALE)
+    boxes_exact, boxes_fast = line_boxes(exact), line_boxes(fast)
+    ious = [box_iou(a, b) for a, b in zip(boxes_exact, boxes_fast)]
+
+    result = {
+        "exact_seconds": exact_seconds,
+        "fast_seconds": fast_seconds,
+        "speedup": exact_seconds / fast_seconds if fast_seconds > 0 else 0.0,
+        "rotated_exact": decisions_exact["rotated"],
+        "rotated_fast": decisions_fast["rotated"],
+        "skew_exact": decisions_exact["skew"],
+        "skew_fast": decisions_fast["skew"],
+        "skew_delta": abs(decisions_exact["skew_applied"] - decisions_fast["skew_applied"]),
+        "lines_exact": len(boxes_exact),
+        "lines_fast": len(boxes_fast),
+        "min_line_iou": min(ious) if ious else 1.0,
+    }
+    result["ok"] = (
+        result["rotated_exact"] == result["rotated_fast"]
+        and result["skew_delta"] <= skew_tolerance
+        and result["lines_exact"] == result["lines_fast"]
+        and result["min_line_iou"] >= min_box_iou
+    )
+    return result
+
+
+def synthetic_pages(count: int, seed: int = 42):
+    """Páginas sintéticas (com inclinação, rotação e pautas) geradas em memória."""
+    from ml.benchmark.synthetic import render_page
+
+    rng = random.Random(seed)
+    for i in range(count):
+        page, _ = render_page(
+            rng,
+            ruled=rng.random() < 0.7,
+            skew=rng.uniform(-4, 4) if rng.random() < 0.6 else 0.0,
+            rotate_90=rng.random() < 0.15,
+        )
+        yield f"synthetic_{i:03d}", 1, page
+
+
+def file_pages(paths):
+    for path in paths:
+        for page_number, img in iter_pages(path):
+            yield path, page_number, img
+
+
+def check_parity(pages, skew_tolerance: float = 0.25, min_box_iou: float = 0.8):
+    """
+    Verifica que o perfil 'fast' dá o mesmo resultado útil que o 'exact'.
+    'pages' é um iterável de (nome, nº da página, imagem BGR).
+    """
+    report = {"skew_tolerance": skew_tolerance, "min_box_iou": min_box_iou, "pages": []}
+    for name, page_number, img in pages:
+        result = compare_page(img, skew_tolerance, min_box_iou)
+        result.update(file=name, page=page_number)
+        report["pages"].append(result)
+
+        status = "✅" if result["ok"] else "❌"
+        print(f"{status} {name} p{page_number}: inclinação Δ{result['skew_delta']:.3f}º | "
+              f"linhas {result['lines_exact']}/{result['lines_fast']} (IoU mín. {result['min_line_iou']:.2f}) | "
+              f"speedup {result['speedup']:.2f}x")
+
+    speedups = [page["speedup"] for page in report["pages"]]
+    report["median_speedup"] = float(np.median(speedups)) if speedups else 0.0
+    report["ok"] = all(page["ok"] for page in report["pages"])
+    print(f"📊 Speedup mediano do perfil 'fast': {report['median_speedup']:.2f}x "
+          f"(o ganho cresce com o tamanho do scan; em A4 é pequeno)")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara os perfis de pré-processamento 'exact' e 'fast'.")
+    parser.add_argument("paths", nargs="*", help="Imagens ou PDFs de exemplo (sem ficheiros: páginas sintéticas)")
+    parser.add_argument("--synthetic", type=int, default=10, help="Nº de páginas sintéticas quando não há ficheiros")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew-tolerance", type=float, default=0.25, help="Diferença máxima de inclinação (graus)")
+    parser.add_argument("--min-box-iou", type=float, default=0.8, help="IoU mínimo entre as caixas de cada linha")
+    parser.add_argument("--output", help="Guardar o relatório em JSON neste ficheiro")
+    args = parser.parse_args()
+
+    pages = file_pages(args.paths) if args.paths else synthetic_pages(args.synthetic, args.seed)
+    report = check_parity(pages, args.skew_tolerance, args.min_box_iou)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    sys.exit(0 if report["ok"] else 1)
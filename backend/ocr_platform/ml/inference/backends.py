@@ -0,0 +1,64 @@
+import os
+
+# Backends de inferência disponíveis (escolhidos com INFERENCE_BACKEND)
+# (o torch só é importado dentro das funções: ler esta lista não o carrega)
+BACKENDS = ("pytorch", "int8", "compile", "onnx")
+
+# Onde ficam os modelos exportados para ONNX (um subdiretório por modelo)
+ONNX_DIR = "models/ocr/onnx"
+
+def quantize_int8(model):
+    """
+    Quantização dinâmica int8 das camadas Linear (encoder e decoder).
+    Os pesos passam a int8 e as ativações são quantizadas em tempo real.
+    Só faz sentido em CPU.
+    """
+    import torch
+
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def compile_model(model):
+    """
+    Compila encoder e decoder com torch.compile.
+    O model.generate continua a funcionar porque só os submódulos são trocados.
+    A primeira chamada é lenta (compilação); as seguintes são mais rápidas.
+    """
+    import torch
+
+    model.eval()
+    model.encoder = torch.compile(model.encoder, dynamic=True)
+    model.decoder = torch.compile(model.decoder, dynamic=True)
+    return model
+
+def _latest_mtime(path: str) -> float:
+    """Data de modificação mais recente entre os ficheiros de uma pasta."""
+    if not os.path.isdir(path):
+        return 0.0
+    return max(
+        (os.path.getmtime(os.path.join(path, f)) for f in os.listdir(path)),
+        default=0.0
+    )
+
+def load_onnx(model_path: str):
+    """
+    Carrega o modelo com ONNX Runtime (decoder com KV-cache).
+    Na primeira vez exporta o modelo para ONNX_DIR; volta a exportar se o
+    modelo original (pasta local) for mais recente que a exportação.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForVision2Seq
+    except ImportError:
+        raise ImportError("Backend 'onnx' precisa do optimum: pip install optimum[onnxruntime]")
+
+    export_dir = os.path.join(ONNX_DIR, os.path.basename(model_path.rstrip("/\\")))
+
+    if os.path.exists(os.path.join(export_dir, "config.json")) and \
+            _latest_mtime(export_dir) >= _latest_mtime(model_path):
+        print(f"⚡ A carregar modelo ONNX: {export_dir}")
+        return ORTModelForVision2Seq.from_pretrained(export_dir, use_cache=True)
+
+    print(f"⚡ A exportar modelo para ONNX (só na primeira vez): {export_dir}")
+    model = ORTModelForVision2Seq.from_pretrained(model_path, export=True, use_cache=True)
+    model.save_pretrained(export_dir)
+    return model
@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import argparse
+import hashlib
+import json
+import shutil
+from datetime import datetime
+
+from ml.inference.registry import VERSIONS_DIR, BASE_MODEL, resolve_current_model, promote
+
+# Um bundle é uma pasta de versão autossuficiente: modelo + processador + tokenizer,
+# com os pesos em safetensors (mapeados em memória ao carregar, sem cópia para a RAM)
+BUNDLE_FILES = ("config.json", "model.safetensors", "preprocessor_config.json")
+MANIFEST_FILE = "bundle.json"
+
+
+def is_bundle(path: str) -> bool:
+    """True se a pasta tem tudo para carregar o modelo sem o Hugging Face Hub."""
+    return os.path.isdir(path) and all(os.path.exists(os.path.join(path, f)) for f in BUNDLE_FILES)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def resolve_source(source: str):
+    """'current' (versão promovida), 'base', nome de uma versão, ou caminho. Devolve (nome, caminho)."""
+    if source == "current":
+        return resolve_current_model()
+    if source == "base":
+        return "base", BASE_MODEL
+    if os.path.isdir(os.path.join(VERSIONS_DIR, source)):
+        return source, os.path.join(VERSIONS_DIR, source)
+    return os.path.basename(source.rstrip("/\\")), source
+
+
+def export_bundle(source: str = "current", name: str = None) -> str:
+    """
+    Grava um bundle em models/ocr/versions/<nome> (precisa de acesso ao Hub só se a
+    origem for o modelo base ou uma versão antiga sem processador).
+    A pasta só aparece quando está completa, e depois é verificada sem rede.
+    Devolve o nome da versão criada.
+    """
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+    source_name, source_path = resolve_source(source)
+    name = name or f"{source_name}-bundle-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    output_dir = os.path.join(VERSIONS_DIR, name)
+    if os.path.exists(output_dir):
+        raise ValueError(f"A versão já existe: {output_dir}")
+
+    processor_path = source_path if os.path.exists(os.path.join(source_path, "preprocessor_config.json")) else BASE_MODEL
+    print(f"📦 A exportar '{source_path}' (processador: {processor_path}) para '{output_dir}'...")
+
+    processor = TrOCRProcessor.from_pretrained(processor_path)
+    model = VisionEncoderDecoderModel.from_pretrained(source_path)
+
+    tmp_dir = output_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    model.save_pretrained(tmp_dir, safe_serialization=True)
+    processor.save_pretrained(tmp_dir)
+
+    # Exemplos já vistos no treino (para o treino incremental continuar a partir deste bundle)
+    for extra in ("trained_examples.json",):
+        if os.path.exists(os.path.join(source_path, extra)):
+            shutil.copy2(os.path.join(source_path, extra), tmp_dir)
+
+    manifest = {
+        "source": source_path,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "files": {f: _sha256(os.path.join(tmp_dir, f)) for f in sorted(os.listdir(tmp_dir))},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp_dir, output_dir)
+
+    # Verificação: tem de carregar só com ficheiros locais
+    TrOCRProcessor.from_pretrained(output_dir, local_files_only=True)
+    VisionEncoderDecoderModel.from_pretrained(output_dir, local_files_only=True)
+    print(f"✅ Bundle '{name}' criado e verificado (sem acesso à rede).")
+    return name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta um modelo para um bundle offline (processador + safetensors).")
+    parser.add_argument("source", nargs="?", default="current",
+                        help="current (versão promovida), base, nome de uma versão ou caminho")
+    parser.add_argument("--name", help="Nome da nova versão (por omissão: <origem>-bundle-<data>)")
+    parser.add_argument("--promote", action="store_true", help="Promover o bundle para produção")
+    args = parser.parse_args()
+
+    version = export_bundle(args.source, args.name)
+    if args.promote:
+        promote(version)
@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import LINE_CACHE_SIZE, LINE_CACHE_PERSISTENT
+from app.core.database import engine
+from app.models.line_cache import OCRCacheLinha
+
+
+def hash_line(line: np.ndarray) -> str:
+    """SHA-256 do recorte (pixels + dimensões), para reconhecer linhas idênticas."""
+    h = hashlib.sha256()
+    h.update(f"{line.shape}{line.dtype}".encode())
+    h.update(np.ascontiguousarray(line).tobytes())
+    return h.hexdigest()
+
+
+class LineCache:
+    """
+    Cache de texto por recorte de linha, em dois níveis:
+      1. LRU em memória (por worker), limitada a 'max_size' entradas;
+      2. tabela ocr_cache_linhas na BD, partilhada por todos os workers.
+    A chave inclui a versão do modelo (e o backend/estratégia, ver trocr.cache_key):
+    um modelo novo volta a ler tudo.
+    """
+    def __init__(self, max_size: int = LINE_CACHE_SIZE, persistent: bool = LINE_CACHE_PERSISTENT):
+        self.max_size = max_size
+        self.persistent = persistent
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.enabled = True
+        self.stats = {"hits_memory": 0, "hits_db": 0, "misses": 0}
+
+    @contextmanager
+    def disabled(self):
+        """Desliga a cache (os dois níveis) dentro do bloco, ex: benchmarks que têm de ler tudo."""
+        self.enabled = False
+        try:
+            yield self
+        finally:
+            self.enabled = True
+
+    def _remember(self, key, value):
+        if self.max_size <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def lookup(self, hashes: list, model_version: str) -> dict:
+        """Devolve {hash: (texto, confiança)} para os hashes já conhecidos."""
+        found = {}
+        if not self.enabled:
+            return found
+        with self._lock:
+            for h in hashes:
+                value = self._memory.get((h, model_version))
+                if value is not None:
+                    self._memory.move_to_end((h, model_version))
+                    found[h] = value
+            self.stats["hits_memory"] += len(found)
+
+        missing = [h for h in set(hashes) if h not in found]
+        if self.persistent and missing:
+            # Ligação própria (e não a sessão do worker, que é partilhada na thread)
+            try:
+                with engine.connect() as conn:
+                    rows = conn.execute(
+                        select(OCRCacheLinha.image_hash, OCRCacheLinha.texto, OCRCacheLinha.confidence)
+                        .where(
+                            OCRCacheLinha.model_version == model_version,
+                            OCRCacheLinha.image_hash.in_(missing)
+                        )
+                    ).all()
+            except Exception as e:
+                print(f"⚠️ Erro ao ler a cache de linhas na BD: {e}")
+                rows = []
+
+            with self._lock:
+                for image_hash, texto, confidence in rows:
+                    found[image_hash] = (texto, confidence)
+                    self._remember((image_hash, model_version), (texto, confidence))
+                self.stats["hits_db"] += len(rows)
+
+        with self._lock:
+            self.stats["misses"] += len([h for h in hashes if h not in found])
+        return found
+
+    def store(self, entries: dict, model_version: str):
+        """Guarda {hash: (texto, confiança)} nos dois níveis."""
+        if not entries or not self.enabled:
+            return
+
+        with self._lock:
+            for h, value in entries.items():
+                self._remember((h, model_version), value)
+
+        if not self.persistent:
+            return
+
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    insert(OCRCacheLinha).values([
+                        {"image_hash": h, "model_version": model_version, "texto": texto, "confidence": confidence}
+                        for h, (texto, confidence) in entries.items()
+                    ]).on_conflict_do_nothing(index_elements=["image_hash", "model_version"])
+                )
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar a cache de linhas na BD: {e}")
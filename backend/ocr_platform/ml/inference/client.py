@@ -0,0 +1,118 @@
+import json
+import struct
+import threading
+import time
+from multiprocessing.connection import Client
+
+import numpy as np
+
+from app.core.config import INFERENCE_SOCKET, INFERENCE_AUTHKEY, INFERENCE_TIMEOUT
+
+
+class InferenceUnavailable(Exception):
+    pass
+
+
+# Formato das mensagens no socket (sem pickle):
+#   pedido:   [4 bytes: tamanho do cabeçalho][cabeçalho JSON {"shapes": [...]}][píxeis uint8 seguidos]
+#   resposta: JSON {"version": ..., "results": [[texto, confiança], ...]} ou {"error": ...}
+
+def encode_lines(lines: list) -> bytes:
+    arrays = [np.ascontiguousarray(line, dtype=np.uint8) for line in lines]
+    header = json.dumps({"shapes": [list(a.shape) for a in arrays]}).encode()
+    return struct.pack("!I", len(header)) + header + b"".join(a.tobytes() for a in arrays)
+
+
+def decode_lines(data: bytes) -> list:
+    (header_size,) = struct.unpack_from("!I", data)
+    header = json.loads(data[4:4 + header_size])
+    lines, offset = [], 4 + header_size
+    for shape in header["shapes"]:
+        size = int(np.prod(shape))
+        lines.append(np.frombuffer(data, np.uint8, size, offset).reshape(shape))
+        offset += size
+    return lines
+
+
+class InferenceClient:
+    """
+    Ligação de um worker ao servidor de inferência da máquina (ml/inference/server.py).
+    Envia os recortes de uma página e recebe (versão do modelo, [(texto, confiança)]).
+    """
+    def __init__(self, address: str = INFERENCE_SOCKET, authkey: str = INFERENCE_AUTHKEY,
+                 connect_retries: int = 10, timeout: float = INFERENCE_TIMEOUT):
+        self.address = address
+        self.authkey = authkey.encode()
+        self.connect_retries = connect_retries
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        for attempt in range(self.connect_retries):
+            try:
+                return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # O servidor pode ainda estar a carregar o modelo
+                time.sleep(min(2 ** attempt, 10))
+        raise InferenceUnavailable(f"Servidor de inferência indisponível em {self.address}")
+
+    def _request(self, payload: bytes) -> dict:
+        if self._conn is None:
+            self._conn = self._connect()
+        self._conn.send_bytes(payload)
+        # Servidor encravado: sem resposta a tempo, a página falha e o documento é libertado
+        # (status 'error'), em vez de o worker ficar bloqueado a renovar a lease para sempre
+        if not self._conn.poll(self.timeout):
+            self.close()
+            raise InferenceUnavailable(f"Sem resposta do servidor de inferência em {self.timeout:.0f} s")
+        return json.loads(self._conn.recv_bytes())
+
+    def read_lines(self, lines: list):
+        """Devolve (versão do modelo, [(texto, confiança)]) pela ordem das linhas."""
+        payload = encode_lines(lines)
+        with self._lock:
+            try:
+                response = self._request(payload)
+            except (EOFError, OSError):
+                # Servidor reiniciado (ex: deploy): uma nova tentativa com ligação nova
+                self.close()
+                response = self._request(payload)
+
+        if "error" in response:
+            raise InferenceUnavailable(response["error"])
+        return response["version"], [tuple(result) for result in response["results"]]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_client = None
+
+def read_lines(lines: list):
+    """
+    Lê as linhas de uma página. Devolve (versão do modelo, [(texto, confiança)]).
+    Com INFERENCE_SOCKET, usa o servidor de inferência da máquina (o modelo fica
+    carregado uma só vez); senão, carrega o modelo neste processo.
+    """
+    global _client
+    if INFERENCE_SOCKET:
+        if _client is None:
+            _client = InferenceClient()
+        return _client.read_lines(lines)
+
+    from ml.inference.trocr import get_model, run_trocr_cached
+
+    # A página inteira é lida com a mesma versão do modelo (mesmo com troca a quente)
+    loaded = get_model()
+    return loaded.version, run_trocr_cached(lines, loaded=loaded)
+
+
+def cache_stats():
+    """Estatísticas da cache de linhas deste processo (None se a inferência é remota)."""
+    if INFERENCE_SOCKET:
+        return None
+    from ml.inference.trocr import line_cache
+    return line_cache.stats
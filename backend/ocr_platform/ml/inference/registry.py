@@ -0,0 +1,151 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import threading
+import time
+from datetime import datetime
+
+from app.core.config import MODEL_RELOAD_CHECK_SECONDS
+
+# Estrutura do registo de modelos:
+#   models/ocr/versions/<versão>/   -> um modelo completo por versão
+#   models/ocr/CURRENT              -> nome da versão promovida (em produção)
+MODELS_DIR = "models/ocr"
+VERSIONS_DIR = os.path.join(MODELS_DIR, "versions")
+CURRENT_FILE = os.path.join(MODELS_DIR, "CURRENT")
+
+# Modelos anteriores ao registo (continuam a funcionar se não houver CURRENT)
+BASE_MODEL = "microsoft/trocr-base-handwritten"
+LEGACY_MODEL = os.path.join(MODELS_DIR, "trocr_finetuned_v1")
+
+
+def read_current_version():
+    """Nome da versão promovida, ou None se ainda não houver registo."""
+    try:
+        with open(CURRENT_FILE, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_current_model():
+    """Devolve (versão, caminho) do modelo que deve estar em produção."""
+    version = read_current_version()
+    if version:
+        path = os.path.join(VERSIONS_DIR, version)
+        if os.path.isdir(path):
+            return version, path
+        print(f"⚠️ Versão promovida '{version}' não existe em {VERSIONS_DIR}. A ignorar.")
+
+    if os.path.exists(LEGACY_MODEL):
+        return "trocr_finetuned_v1", LEGACY_MODEL
+    return "base", BASE_MODEL
+
+
+def new_version_dir():
+    """Reserva um nome de versão novo (data/hora) e devolve (versão, caminho)."""
+    version = datetime.now().strftime("v%Y%m%d_%H%M%S")
+    return version, os.path.join(VERSIONS_DIR, version)
+
+
+def list_versions():
+    if not os.path.isdir(VERSIONS_DIR):
+        return []
+    return sorted(os.listdir(VERSIONS_DIR))
+
+
+def promote(version: str):
+    """
+    Põe uma versão em produção. A escrita é atómica (os.replace), por isso
+    os workers nunca leem um CURRENT a meio. Serve também para rollback.
+    """
+    if not os.path.isdir(os.path.join(VERSIONS_DIR, version)):
+        raise ValueError(f"Versão não encontrada: {version}")
+
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    tmp_path = CURRENT_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, CURRENT_FILE)
+    print(f"🚀 Versão '{version}' promovida para produção.")
+
+
+class LoadedModel:
+    """Um modelo carregado e a versão a que pertence (nunca muda depois de criado)."""
+    def __init__(self, version: str, processor, model):
+        self.version = version
+        self.processor = processor
+        self.model = model
+
+
+class ModelRegistry:
+    """
+    Carrega o modelo só no primeiro uso e troca-o a quente quando outra versão
+    é promovida. A nova versão é carregada e aquecida numa thread de fundo,
+    enquanto a antiga continua a servir; depois a referência é trocada.
+    Quem já tem um LoadedModel na mão (lote em curso) termina com os pesos antigos.
+    """
+    def __init__(self, loader, warmup=None, check_interval: int = MODEL_RELOAD_CHECK_SECONDS):
+        self.loader = loader            # loader(caminho) -> (processor, model)
+        self.warmup = warmup            # warmup(LoadedModel), opcional
+        self.check_interval = check_interval
+        self._current = None
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._last_check = 0.0
+
+    def _load(self, version: str, path: str) -> LoadedModel:
+        processor, model = self.loader(path)
+        loaded = LoadedModel(version, processor, model)
+        if self.warmup:
+            self.warmup(loaded)
+        return loaded
+
+    def _reload_in_background(self, version: str, path: str):
+        try:
+            print(f"🔄 Nova versão do modelo detetada: {version}. A carregar em segundo plano...")
+            loaded = self._load(version, path)
+            with self._lock:
+                self._current = loaded
+            print(f"✅ Modelo trocado a quente para a versão {version}.")
+        except Exception as e:
+            print(f"❌ Erro ao carregar a versão {version} (mantém-se a anterior): {e}")
+        finally:
+            self._reloading = False
+
+    def _check_for_new_version(self):
+        now = time.monotonic()
+        if self.check_interval <= 0 or self._reloading or now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        version, path = resolve_current_model()
+        if version != self._current.version:
+            self._reloading = True
+            threading.Thread(
+                target=self._reload_in_background, args=(version, path), daemon=True
+            ).start()
+
+    def get(self) -> LoadedModel:
+        """Modelo atual (carrega-o na primeira chamada)."""
+        with self._lock:
+            if self._current is None:
+                version, path = resolve_current_model()
+                self._current = self._load(version, path)
+                self._last_check = time.monotonic()
+                return self._current
+            current = self._current
+
+        self._check_for_new_version()
+        return current
+
+
+if __name__ == "__main__":
+    # python ml/inference/registry.py            -> listar versões
+    # python ml/inference/registry.py <versão>   -> promover (ou fazer rollback)
+    if len(sys.argv) > 1:
+        promote(sys.argv[1])
+    else:
+        current = read_current_version()
+        for v in list_versions():
+            print(f"{'*' if v == current else ' '} {v}")
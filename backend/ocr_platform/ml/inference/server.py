@@ -0,0 +1,143 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Listener
+
+from app.core.config import (
+    INFERENCE_SOCKET, INFERENCE_AUTHKEY, INFERENCE_MAX_BATCH_LINES,
+    INFERENCE_MAX_WAIT_MS, INFERENCE_METRICS_PORT
+)
+from app.core.metrics import (
+    STAGE_SECONDS, LINES_PROCESSED, INFERENCE_BATCH_LINES, INFERENCE_BATCH_REQUESTS,
+    start_metrics_server
+)
+from ml.inference.client import decode_lines
+from ml.inference.trocr import get_model, run_trocr_cached, line_cache
+
+DEFAULT_SOCKET = "/tmp/ocr_inference.sock"
+
+
+class DynamicBatcher:
+    """
+    Junta os pedidos (páginas) de vários workers num só lote para o modelo:
+    o lote fecha quando chega a max_lines linhas ou passam max_wait_ms
+    desde o primeiro pedido. Um pedido nunca é partido, por isso todas as
+    linhas de uma página são lidas com a mesma versão do modelo.
+    """
+    def __init__(self, max_lines: int = INFERENCE_MAX_BATCH_LINES, max_wait_ms: int = INFERENCE_MAX_WAIT_MS):
+        self.max_lines = max_lines
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, lines: list) -> Future:
+        future = Future()
+        self._queue.put((lines, future))
+        return future
+
+    def _collect(self):
+        """Bloqueia até ao primeiro pedido e junta os seguintes até encher o lote ou acabar o tempo."""
+        batch = [self._queue.get()]
+        total = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while total < self.max_lines:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            total += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            lines = [line for request_lines, _ in batch for line in request_lines]
+            INFERENCE_BATCH_LINES.observe(len(lines))
+            INFERENCE_BATCH_REQUESTS.observe(len(batch))
+
+            try:
+                loaded = get_model()
+                start = time.perf_counter()
+                # A cache também evita ler duas vezes o mesmo recorte vindo de documentos diferentes.
+                # O lote do modelo é o lote dinâmico inteiro (INFERENCE_MAX_BATCH_LINES manda nos dois)
+                results = run_trocr_cached(lines, batch_size=self.max_lines, loaded=loaded)
+                STAGE_SECONDS.labels("inference").observe(time.perf_counter() - start)
+                LINES_PROCESSED.inc(len(lines))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_lines, future in batch:
+                future.set_result((loaded.version, results[offset:offset + len(request_lines)]))
+                offset += len(request_lines)
+
+
+def serve_connection(conn, batcher: DynamicBatcher):
+    """Uma thread por worker ligado: cada mensagem é uma página de recortes."""
+    try:
+        while True:
+            try:
+                payload = conn.recv_bytes()
+            except EOFError:
+                return  # Worker desligou-se
+
+            try:
+                version, results = batcher.submit(decode_lines(payload)).result()
+                response = {"version": version, "results": results}
+            except Exception as e:
+                print(f"❌ Erro na inferência: {e}")
+                response = {"error": str(e)}
+            conn.send_bytes(json.dumps(response).encode())
+    finally:
+        conn.close()
+
+
+def start_server(address: str = INFERENCE_SOCKET or DEFAULT_SOCKET):
+    print(f"🧠 Servidor de inferência a iniciar em {address}...")
+
+    # Carregar (e aquecer) o modelo antes de aceitar pedidos
+    loaded = get_model()
+    print(f"   Modelo '{loaded.version}' carregado.")
+
+    if INFERENCE_METRICS_PORT and start_metrics_server(INFERENCE_METRICS_PORT):
+        print(f"   📊 Métricas em :{INFERENCE_METRICS_PORT}/metrics")
+
+    # Socket antigo de uma execução anterior
+    if os.path.exists(address):
+        os.remove(address)
+    os.makedirs(os.path.dirname(address) or ".", exist_ok=True)
+
+    batcher = DynamicBatcher()
+    batcher.start()
+
+    with Listener(address, family="AF_UNIX", authkey=INFERENCE_AUTHKEY.encode()) as listener:
+        print(f"✅ A aceitar pedidos (lotes até {batcher.max_lines} linhas / {INFERENCE_MAX_WAIT_MS} ms).")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Ligação com chave errada ou cortada durante o handshake
+                    print(f"⚠️ Ligação recusada: {e}")
+                    continue
+                threading.Thread(target=serve_connection, args=(conn, batcher), daemon=True).start()
+        finally:
+            print(f"   🗃️ Cache de linhas: {line_cache.stats}")
+
+
+if __name__ == "__main__":
+    start_server()
@@ -1,34 +1,118 @@
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
-import torch
 import numpy as np
 import os
+from app.core.config import (
+    INFERENCE_THREADS, INFERENCE_BACKEND, DECODING_STRATEGY, CONFIDENCE_THRESHOLD, MODEL_OFFLINE
+)
+from ml.inference.backends import BACKENDS
+from ml.inference.registry import ModelRegistry, resolve_current_model, BASE_MODEL
+from ml.inference.bundle import is_bundle
+from ml.inference.cache import LineCache, hash_line
 
-# Definição de caminhos
-BASE_MODEL = "microsoft/trocr-base-handwritten"
-LOCAL_MODEL = "models/ocr/trocr_finetuned_v1"
+# Nº de linhas decodificadas por cada chamada ao model.generate
+BATCH_SIZE = 8
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
+# Parâmetros de geração com beam search (melhor qualidade, mais lento)
+GENERATION_KWARGS = {
+    "max_length": 64,
+    "num_beams": 4,            # Tenta 4 caminhos diferentes (melhor qualidade)
+    "early_stopping": True,    # Para quando a frase estiver completa
+    "no_repeat_ngram_size": 3, # Evita repetir palavras (ex: "Luanda Luanda")
+}
 
-def load_model():
+# Parâmetros de geração greedy (1 caminho, ~4x mais barato que o beam search)
+GREEDY_KWARGS = {
+    "max_length": 64,
+    "num_beams": 1,
+    "no_repeat_ngram_size": 3,
+}
+
+DECODING_STRATEGIES = ("adaptive", "greedy", "beam")
+
+# O torch (tal como o transformers) só é importado no primeiro uso: importar este módulo
+# é barato (ex: para ler constantes, ou num worker que usa o servidor de inferência)
+_device = None
+
+def get_device() -> str:
+    """Dispositivo da inferência. Na primeira chamada importa o torch e limita as threads."""
+    global _device
+    if _device is None:
+        import torch
+
+        # Limitar as threads da inferência para deixar núcleos livres ao pré-processamento
+        if INFERENCE_THREADS > 0:
+            torch.set_num_threads(INFERENCE_THREADS)
+        _device = "cuda" if torch.cuda.is_available() else "cpu"
+    return _device
+
+# Tem de ser definido antes do primeiro import do transformers
+if MODEL_OFFLINE:
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+def load_model(backend: str = INFERENCE_BACKEND, model_path: str = None):
     """
-    Carrega o processador (sempre da base) e o modelo (local se existir).
+    Carrega o processador e o modelo.
+    Sem model_path, usa a versão promovida no registo (ver ml/inference/registry.py).
+    Um bundle (ver ml/inference/bundle.py) traz o seu próprio processador e é lido
+    só do disco, sem consultar o Hub; os pesos safetensors são mapeados em memória.
+    O backend define como o modelo corre (ver ml/inference/backends.py).
     """
-    print(f"🔧 A carregar processador base: {BASE_MODEL}")
-    processor = TrOCRProcessor.from_pretrained(BASE_MODEL)
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de inferência desconhecido: {backend} (opções: {', '.join(BACKENDS)})")
 
-    if os.path.exists(LOCAL_MODEL):
-        print(f"🧠 A carregar modelo treinado localmente (Português/Angola): {LOCAL_MODEL}")
-        model = VisionEncoderDecoderModel.from_pretrained(LOCAL_MODEL)
-    else:
+    # Imports pesados (vários segundos): só quando o modelo é mesmo preciso
+    device = get_device()
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+    from ml.inference.backends import quantize_int8, compile_model, load_onnx
+
+    if model_path is None:
+        _, model_path = resolve_current_model()
+
+    bundle = is_bundle(model_path)
+    local_only = bundle or MODEL_OFFLINE
+    processor_path = model_path if bundle else BASE_MODEL
+
+    print(f"🔧 A carregar processador: {processor_path}")
+    processor = TrOCRProcessor.from_pretrained(processor_path, local_files_only=local_only)
+
+    if model_path == BASE_MODEL:
         print(f"🌐 A carregar modelo base (Inglês): {BASE_MODEL}")
-        model = VisionEncoderDecoderModel.from_pretrained(BASE_MODEL)
+    else:
+        print(f"🧠 A carregar modelo treinado localmente (Português/Angola): {model_path}")
+
+    if backend == "onnx":
+        return processor, load_onnx(model_path)
+
+    model = VisionEncoderDecoderModel.from_pretrained(
+        model_path, local_files_only=local_only, low_cpu_mem_usage=True
+    )
+    model.eval()
+
+    if backend == "int8":
+        print("⚡ Backend int8: quantização dinâmica das camadas Linear (CPU).")
+        return processor, quantize_int8(model)
 
     model.to(device)
+    if backend == "compile":
+        print("⚡ Backend compile: torch.compile no encoder e decoder.")
+        model = compile_model(model)
+
     return processor, model
 
-# Carregar recursos globais
-processor, model = load_model()
+def warm_up(loaded):
+    """
+    Passagem de aquecimento com uma linha em branco, para a primeira linha
+    real não pagar a alocação de memória (e a compilação, no backend compile).
+    """
+    blank = Image.new("RGB", (384, 64), "white")
+    decode_images([blank], loaded.processor, loaded.model)
+
+# O modelo só é carregado no primeiro uso (e trocado a quente quando há nova versão)
+registry = ModelRegistry(loader=lambda path: load_model(model_path=path), warmup=warm_up)
+
+def get_model():
+    """Modelo atual (LoadedModel com version, processor e model)."""
+    return registry.get()
 
 def run_trocr(image_np: np.ndarray):
     """
@@ -36,20 +120,159 @@ def run_trocr(image_np: np.ndarray):
     """
     try:
         image = Image.fromarray(image_np).convert("RGB")
-        pixel_values = processor(images=image, return_tensors="pt").pixel_values.to(device)
-
-        # MUDANÇA AQUI: Adicionei num_beams=4 e penalidades
-        # Isto ajuda o modelo a focar-se melhor e cometer menos erros de "alucinação"
-        generated_ids = model.generate(
-            pixel_values,
-            max_length=64,
-            num_beams=4,           # Tenta 4 caminhos diferentes (melhor qualidade)
-            early_stopping=True,   # Para quando a frase estiver completa
-            no_repeat_ngram_size=3 # Evita repetir palavras (ex: "Luanda Luanda")
-        )
-        
-        text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+        loaded = get_model()
+        text, _ = decode_images([image], loaded.processor, loaded.model)[0]
         return text
     except Exception as e:
         print(f"❌ Erro na inferência do TrOCR: {e}")
-        return ""
\ No newline at end of file
+        return ""
+
+def _bucket_by_width(lines: list) -> list:
+    """
+    Devolve os índices das linhas ordenados pela proporção largura/altura.
+    Linhas curtas e longas geram sequências de tamanho muito diferente;
+    agrupá-las evita que o beam search de um lote espere pela linha mais longa.
+    """
+    return sorted(
+        range(len(lines)),
+        key=lambda i: lines[i].shape[1] / max(1, lines[i].shape[0])
+    )
+
+def _sequence_confidences(outputs, processor, model, num_beams: int) -> list:
+    """
+    Confiança (0-1) de cada sequência gerada: média geométrica das
+    probabilidades dos tokens escolhidos (exp da log-prob média).
+    """
+    import torch
+
+    if num_beams > 1:
+        # O beam search já devolve a log-prob da sequência normalizada pelo comprimento
+        return torch.exp(outputs.sequences_scores).tolist()
+
+    token_logprobs = model.compute_transition_scores(
+        outputs.sequences, outputs.scores, normalize_logits=True
+    )
+    # sequences começa com o token inicial do decoder, que não tem score
+    generated = outputs.sequences[:, 1:]
+    mask = generated != processor.tokenizer.pad_token_id
+    token_logprobs = torch.where(mask, token_logprobs, torch.zeros_like(token_logprobs))
+    mean_logprob = token_logprobs.sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    return torch.exp(mean_logprob).tolist()
+
+def generate_with_confidence(images: list, processor, model, generation_kwargs=GENERATION_KWARGS) -> list:
+    """Um único model.generate para uma lista de imagens PIL. Devolve [(texto, confiança)]."""
+    import torch
+
+    pixel_values = processor(images=images, return_tensors="pt").pixel_values.to(model.device)
+
+    with torch.no_grad():
+        outputs = model.generate(
+            pixel_values,
+            output_scores=True,
+            return_dict_in_generate=True,
+            **generation_kwargs
+        )
+
+    texts = processor.batch_decode(outputs.sequences, skip_special_tokens=True)
+    confidences = _sequence_confidences(outputs, processor, model, generation_kwargs["num_beams"])
+    return list(zip(texts, confidences))
+
+def decode_images(images: list, processor, model,
+                  strategy: str = DECODING_STRATEGY,
+                  threshold: float = CONFIDENCE_THRESHOLD) -> list:
+    """
+    Lê um lote de imagens segundo a estratégia escolhida. Devolve [(texto, confiança)].
+    Em 'adaptive', tudo é lido primeiro em greedy e só as linhas com confiança
+    abaixo do threshold voltam a ser lidas com beam search.
+    """
+    if strategy not in DECODING_STRATEGIES:
+        raise ValueError(f"Estratégia de decodificação desconhecida: {strategy}")
+
+    if strategy == "beam":
+        return generate_with_confidence(images, processor, model, GENERATION_KWARGS)
+
+    results = generate_with_confidence(images, processor, model, GREEDY_KWARGS)
+    if strategy == "greedy":
+        return results
+
+    unsure = [i for i, (_, confidence) in enumerate(results) if confidence < threshold]
+    if unsure:
+        retried = generate_with_confidence([images[i] for i in unsure], processor, model, GENERATION_KWARGS)
+        for i, result in zip(unsure, retried):
+            results[i] = result
+
+    return results
+
+def run_trocr_batch(lines: list, batch_size: int = BATCH_SIZE, loaded=None) -> list:
+    """
+    Lê várias linhas (arrays numpy) com poucas chamadas ao model.generate.
+    Devolve [(texto, confiança)] pela mesma ordem das linhas recebidas,
+    com None nas linhas cuja leitura falhou (para não serem guardadas na cache).
+    Todas as linhas são lidas com o mesmo modelo ('loaded'), mesmo que
+    entretanto seja promovida outra versão.
+    """
+    if loaded is None:
+        loaded = get_model()
+    processor, model = loaded.processor, loaded.model
+
+    results = [None] * len(lines)
+    order = _bucket_by_width(lines)
+
+    for start in range(0, len(order), batch_size):
+        batch_idx = order[start:start + batch_size]
+        images = [Image.fromarray(lines[i]).convert("RGB") for i in batch_idx]
+        try:
+            decoded = decode_images(images, processor, model)
+            for i, result in zip(batch_idx, decoded):
+                results[i] = result
+        except Exception as e:
+            # Se o lote falhar, tenta linha a linha para não perder o resto
+            print(f"⚠️ Erro no lote do TrOCR ({e}). A tentar linha a linha...")
+            for i, image in zip(batch_idx, images):
+                try:
+                    results[i] = decode_images([image], processor, model)[0]
+                except Exception as e:
+                    print(f"❌ Erro na inferência do TrOCR: {e}")
+
+    return results
+
+# Cache de recortes já lidos (memória + BD), partilhada por todos os documentos do worker
+line_cache = LineCache()
+
+def cache_key(loaded) -> str:
+    """
+    Chave da cache para o modelo carregado: a versão, o backend e a estratégia
+    de decodificação (int8 e fp32, ou greedy e beam, podem ler a mesma linha de forma diferente).
+    """
+    key = f"{loaded.version}|{INFERENCE_BACKEND}|{DECODING_STRATEGY}"
+    if DECODING_STRATEGY == "adaptive":
+        key += f"@{CONFIDENCE_THRESHOLD}"
+    return key
+
+def run_trocr_cached(lines: list, batch_size: int = BATCH_SIZE, loaded=None, cache=line_cache) -> list:
+    """
+    Igual ao run_trocr_batch, mas as linhas idênticas a outras já lidas
+    (com a mesma versão do modelo, backend e estratégia) vêm da cache e não passam pelo modelo.
+    Só as leituras bem-sucedidas são guardadas: uma linha que falhou (ex: falta de memória)
+    volta como ("", 0.0) e é lida de novo da próxima vez.
+    """
+    if loaded is None:
+        loaded = get_model()
+
+    hashes = [hash_line(line) for line in lines]
+    key = cache_key(loaded)
+    cached = cache.lookup(hashes, key)
+
+    # Ler só as linhas novas (e cada recorte repetido só uma vez)
+    to_read = {}
+    for line, h in zip(lines, hashes):
+        if h not in cached and h not in to_read:
+            to_read[h] = line
+
+    if to_read:
+        new_results = run_trocr_batch(list(to_read.values()), batch_size, loaded)
+        fresh = dict(zip(to_read.keys(), new_results))
+        cache.store({h: result for h, result in fresh.items() if result is not None}, key)
+        cached.update(fresh)
+
+    return [cached[h] or ("", 0.0) for h in hashes]
@@ -1,32 +1,87 @@
+import time
 import cv2
 import numpy as np
 import fitz  # PyMuPDF
 
-def load_image_or_pdf(path: str) -> np.ndarray:
-    """Carrega PDF ou Imagem com alta resolução."""
+# Zoom 2.0x é crucial para ver traços finos
+PDF_ZOOM = 2.0
+
+def _pixmap_to_bgr(pix) -> np.ndarray:
+    img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
+
+    if pix.n == 3: img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+    elif pix.n == 4: img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGR)
+    return img_array
+
+def count_pages(path: str) -> int:
+    """Nº de páginas do ficheiro (imagens contam como 1 página)."""
+    if path.lower().endswith(".pdf"):
+        try:
+            with fitz.open(path) as doc:
+                return doc.page_count
+        except Exception as e:
+            raise ValueError(f"Erro ao abrir PDF: {e}")
+    return 1
+
+def iter_pages(path: str):
+    """
+    Gerador que devolve (numero_pagina, imagem) uma página de cada vez.
+    As páginas do PDF só são renderizadas quando pedidas, por isso
+    a memória fica limitada a uma página, mesmo em livros de registo grandes.
+    A numeração começa em 1.
+    """
     if path.lower().endswith(".pdf"):
         try:
             doc = fitz.open(path)
-            # Zoom 2.0x é crucial para ver traços finos
-            mat = fitz.Matrix(2.0, 2.0)
-            page = doc[0]
-            pix = page.get_pixmap(matrix=mat)
-            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
-            
-            if pix.n == 3: img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            elif pix.n == 4: img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGR)
-            return img_array
         except Exception as e:
             raise ValueError(f"Erro ao converter PDF: {e}")
+
+        with doc:
+            mat = fitz.Matrix(PDF_ZOOM, PDF_ZOOM)
+            for index in range(doc.page_count):
+                try:
+                    pix = doc[index].get_pixmap(matrix=mat)
+                    img_array = _pixmap_to_bgr(pix)
+                except Exception as e:
+                    raise ValueError(f"Erro ao converter página {index + 1} do PDF: {e}")
+                del pix
+                yield index + 1, img_array
     else:
         img = cv2.imread(path)
         if img is None: raise ValueError(f"Não foi possível ler: {path}")
+        yield 1, img
+
+def render_page(path: str, page_number: int) -> np.ndarray:
+    """
+    Renderiza uma única página (numeração a partir de 1).
+    Útil para processos paralelos, que só precisam de receber o caminho.
+    """
+    if path.lower().endswith(".pdf"):
+        try:
+            with fitz.open(path) as doc:
+                pix = doc[page_number - 1].get_pixmap(matrix=fitz.Matrix(PDF_ZOOM, PDF_ZOOM))
+                return _pixmap_to_bgr(pix)
+        except Exception as e:
+            raise ValueError(f"Erro ao converter página {page_number} do PDF: {e}")
+
+    if page_number != 1:
+        raise ValueError(f"Imagem só tem uma página: {path}")
+    img = cv2.imread(path)
+    if img is None: raise ValueError(f"Não foi possível ler: {path}")
+    return img
+
+def load_image_or_pdf(path: str) -> np.ndarray:
+    """Carrega PDF (primeira página) ou Imagem com alta resolução."""
+    for _, img in iter_pages(path):
         return img
+    raise ValueError(f"PDF sem páginas: {path}")
 
-def normalize_background(image):
+def normalize_background(image, scale: float = 1.0):
     """
     Remove o fundo do papel (amarelo/ruído), deixando-o branco.
     Ideal para documentos históricos.
+    Com scale < 1, o fundo é estimado numa cópia reduzida e depois ampliado
+    (o fundo do papel varia devagar, por isso quase não se perde nada).
     """
     # 1. Converter para escala de cinzentos
     if len(image.shape) == 3:
@@ -36,8 +91,15 @@ def normalize_background(image):
 
     # 2. Morfologia para estimar o fundo (ignora letras, vê só o papel)
     # Kernel grande (25x25) para não apagar letras grandes
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 25))
-    background = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
+    if scale < 1.0:
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        size = max(3, int(round(25 * scale)))
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+        background = cv2.morphologyEx(small, cv2.MORPH_CLOSE, kernel)
+        background = cv2.resize(background, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_LINEAR)
+    else:
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 25))
+        background = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
 
     # 3. Divisão (Normalização)
     # Ao dividir a imagem pelo fundo, tudo o que é fundo vira branco (255)
@@ -83,8 +145,9 @@ def ensure_horizontal_orientation(binary_image, original_image):
     proj_0 = np.sum(binary_image, axis=1)
     var_0 = np.var(proj_0)
 
-    rotated_bin_90 = cv2.rotate(binary_image, cv2.ROTATE_90_CLOCKWISE)
-    proj_90 = np.sum(rotated_bin_90, axis=1)
+    # A projeção por linhas da imagem rodada 90º é a projeção por colunas
+    # da original (invertida), com a mesma variância: não é preciso rodar para medir
+    proj_90 = np.sum(binary_image, axis=0)
     var_90 = np.var(proj_90)
 
     print(f"   -> Variância 0º: {var_0:.0f} | Variância 90º: {var_90:.0f}")
@@ -92,19 +155,33 @@ def ensure_horizontal_orientation(binary_image, original_image):
     # Se a variância a 90º for muito maior, roda.
     if var_90 > var_0 * 1.3:
         print("   -> Rotação: Documento deitado detetado. A rodar 90º.")
+        rotated_bin_90 = cv2.rotate(binary_image, cv2.ROTATE_90_CLOCKWISE)
         rotated_img = cv2.rotate(original_image, cv2.ROTATE_90_CLOCKWISE)
         return rotated_bin_90, rotated_img
     
     return binary_image, original_image
 
-def correct_small_skew(image, binary_image):
-    """Corrige inclinações subtis (<10º)."""
+def estimate_skew_angle(binary_image, scale: float = 1.0):
+    """
+    Ângulo de inclinação do texto (graus), ou None se não houver tinta.
+    Com scale < 1, mede numa cópia reduzida: o ângulo não muda com a escala
+    e o minAreaRect recebe muito menos pontos.
+    """
+    if scale < 1.0:
+        binary_image = cv2.resize(binary_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
     coords = np.column_stack(np.where(binary_image > 0))
-    if len(coords) == 0: return image, binary_image
+    if len(coords) == 0: return None
     
     angle = cv2.minAreaRect(coords)[-1]
     if angle < -45: angle = -(90 + angle)
     else: angle = -angle
+    return angle
+
+def correct_small_skew(image, binary_image, scale: float = 1.0):
+    """Corrige inclinações subtis (<10º)."""
+    angle = estimate_skew_angle(binary_image, scale)
+    if angle is None: return image, binary_image
 
     if abs(angle) > 0.5 and abs(angle) < 10:
         (h, w) = image.shape[:2]
@@ -116,24 +193,67 @@ def correct_small_skew(image, binary_image):
     
     return image, binary_image
 
-def preprocess_image(image_path: str) -> np.ndarray:
-    # 1. Carregar
-    img = load_image_or_pdf(image_path)
-    
+# Perfis de pré-processamento:
+#   exact - tudo em resolução total (comportamento original)
+#   fast  - fundo e inclinação medidos numa cópia reduzida; só a transformação
+#           final é aplicada em resolução total (para scans grandes, ex: A3)
+PREPROCESS_PROFILES = ("exact", "fast")
+FAST_SCALE = 0.25
+
+def timed(timings, stage: str, fn, *args):
+    """
+    Chama fn(*args) e, se 'timings' for um dict, soma a duração (s) em timings[stage].
+    Serve para medir etapas em processos paralelos e enviar os tempos de volta.
+    """
+    if timings is None:
+        return fn(*args)
+    start = time.perf_counter()
+    result = fn(*args)
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+    return result
+
+def preprocess_page(img: np.ndarray, profile: str = "exact", timings: dict = None) -> np.ndarray:
+    """Limpeza completa de uma página já carregada em memória."""
+    if profile not in PREPROCESS_PROFILES:
+        raise ValueError(f"Perfil de pré-processamento desconhecido: {profile}")
+    scale = FAST_SCALE if profile == "fast" else 1.0
+
     # 2. Normalizar Fundo (Técnica nova)
-    binary, _ = normalize_background(img)
+    binary, _ = timed(timings, "normalize", normalize_background, img, scale)
     
     # 3. Limpezas (Bordas pretas e linhas de tabela)
-    clean_binary = remove_lines_and_borders(binary)
+    clean_binary = timed(timings, "line_removal", remove_lines_and_borders, binary)
     
     # 4. Rotação e Orientação
-    clean_binary, img = ensure_horizontal_orientation(clean_binary, img)
-    img, clean_binary = correct_small_skew(img, clean_binary)
+    clean_binary, img = timed(timings, "orientation", ensure_horizontal_orientation, clean_binary, img)
+    img, clean_binary = timed(timings, "skew", correct_small_skew, img, clean_binary, scale)
 
     return clean_binary
 
-def segment_lines(image: np.ndarray):
-    """Segmentação robusta com threshold dinâmico."""
+def preprocess_image(image_path: str, profile: str = "exact") -> np.ndarray:
+    # 1. Carregar (só a primeira página; para PDFs completos usar iter_preprocessed_pages)
+    img = load_image_or_pdf(image_path)
+    return preprocess_page(img, profile)
+
+def iter_preprocessed_pages(path: str, profile: str = "exact"):
+    """Gerador de (numero_pagina, imagem_binaria_limpa), uma página de cada vez."""
+    for page_number, img in iter_pages(path):
+        yield page_number, preprocess_page(img, profile)
+
+def _find_runs(mask: np.ndarray):
+    """
+    Run-length em NumPy: devolve (inícios, fins) dos troços True de um vetor booleano.
+    Os fins são exclusivos; um troço aberto até ao fim termina em len(mask).
+    """
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    changes = np.diff(padded)
+    return np.flatnonzero(changes == 1), np.flatnonzero(changes == -1)
+
+def find_line_spans(image: np.ndarray):
+    """
+    Devolve as faixas horizontais de texto como (y0, y1, aberta).
+    'aberta' indica uma linha que chega ao fundo da página (não tem fim detetado).
+    """
     # Dilatação para unir palavras
     width_kernel = max(25, int(image.shape[1] * 0.03)) 
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (width_kernel, 1))
@@ -148,27 +268,118 @@ def segment_lines(image: np.ndarray):
         threshold = np.mean(non_zero_proj) * 0.2
     else:
         threshold = 1
-    
-    lines = []
-    start = None
+
     margin = 5
+    height = image.shape[0]
+    starts, ends = _find_runs(projection > threshold)
+
+    spans = []
+    for start, end in zip(starts, ends):
+        is_open = end == height
+        spans.append((max(0, start - margin), height if is_open else min(height, end + margin), is_open))
+    return spans
+
+def segment_lines(image: np.ndarray):
+    """Segmentação robusta com threshold dinâmico."""
+    lines = []
+    for y0, y1, is_open in find_line_spans(image):
+        roi = image[y0:y1, :]
+
+        # Filtro de qualidade rigoroso
+        # Ignora manchas pequenas (<20px altura) ou sem tinta suficiente
+        if is_open or (roi.shape[0] > 20 and roi.shape[1] > 50 and cv2.countNonZero(roi) > 100):
+            lines.append(cv2.bitwise_not(roi))
+
+    return lines
+
+def _split_at_widest_gap(chunk, starts, ends, max_width: float) -> list:
+    """
+    Parte um pedaço largo demais no maior espaço em branco interior (entre troços de tinta),
+    recursivamente, até cada parte caber em max_width. Sem espaço interior (tinta contínua),
+    o pedaço fica como está: cortar a meio de uma letra estragaria a leitura.
+    """
+    x0, x1 = chunk
+    if x1 - x0 <= max_width:
+        return [chunk]
+
+    inside = [i for i in range(len(starts)) if starts[i] >= x0 and ends[i] <= x1]
+    if len(inside) < 2:
+        return [chunk]
+
+    # Espaço i = entre o troço inside[i] e o inside[i + 1]
+    gaps = [starts[inside[i + 1]] - ends[inside[i]] for i in range(len(inside) - 1)]
+    widest = int(np.argmax(gaps))
+    left = [x0, ends[inside[widest]]]
+    right = [starts[inside[widest + 1]], x1]
+    return _split_at_widest_gap(left, starts, ends, max_width) + _split_at_widest_gap(right, starts, ends, max_width)
+
+def split_line_into_chunks(line_binary: np.ndarray, max_aspect: float = 8.0, min_gap_ratio: float = 0.3):
+    """
+    Divide uma linha (binária, tinta=255) em pedaços de palavras/frases.
+    Corta nos espaços em branco da projeção vertical com largura >= min_gap_ratio * altura,
+    e volta a juntar palavras vizinhas enquanto o pedaço não passar de max_aspect (largura/altura).
+    Uma "palavra" que sozinha passe de max_aspect é partida no seu maior espaço interior.
+    As margens em branco à esquerda e à direita são descartadas.
+    Devolve [(x0, x1)].
+    """
+    height = line_binary.shape[0]
+    ink_columns = np.count_nonzero(line_binary, axis=0) > 0
+    if not ink_columns.any():
+        return []
+
+    # Palavras = troços de colunas com tinta, separados por espaços largos
+    starts, ends = _find_runs(ink_columns)
+    min_gap = max(1, int(height * min_gap_ratio))
+    words = [[starts[0], ends[0]]]
+    for start, end in zip(starts[1:], ends[1:]):
+        if start - words[-1][1] < min_gap:
+            words[-1][1] = end
+        else:
+            words.append([start, end])
+
+    # Juntar palavras em frases até ao limite de proporção
+    max_width = max_aspect * height
+    chunks = [list(words[0])]
+    for start, end in words[1:]:
+        if end - chunks[-1][0] <= max_width:
+            chunks[-1][1] = end
+        else:
+            chunks.append([start, end])
+
+    # Garantir o limite também nos pedaços com uma só "palavra" larga demais
+    chunks = [part for chunk in chunks for part in _split_at_widest_gap(chunk, starts, ends, max_width)]
+
+    return [(int(x0), int(x1)) for x0, x1 in chunks]
+
+def segment_regions(image: np.ndarray, split_words: bool = False, max_aspect: float = 8.0,
+                    min_gap_ratio: float = 0.3):
+    """
+    Como o segment_lines, mas devolve cada região com a sua posição na página:
+    [{"image": recorte, "linha": nº da linha, "bbox": (x, y, w, h)}]
+    Com split_words=True, as linhas longas são partidas em pedaços de palavras/frases
+    (recortes mais pequenos e uniformes: menos detalhe perdido no resize do TrOCR
+    e lotes mais eficientes). O texto da linha reconstrói-se juntando os pedaços por x.
+    """
+    regions = []
+    line_index = 0
+    width = image.shape[1]
+
+    for y0, y1, is_open in find_line_spans(image):
+        roi = image[y0:y1, :]
+        if not (is_open or (roi.shape[0] > 20 and roi.shape[1] > 50 and cv2.countNonZero(roi) > 100)):
+            continue
+
+        if split_words:
+            spans = split_line_into_chunks(roi, max_aspect=max_aspect, min_gap_ratio=min_gap_ratio)
+        else:
+            spans = [(0, width)]
+
+        for x0, x1 in spans:
+            regions.append({
+                "image": cv2.bitwise_not(roi[:, x0:x1]),
+                "linha": line_index,
+                "bbox": (x0, int(y0), x1 - x0, int(y1 - y0)),
+            })
+        line_index += 1
 
-    for i, value in enumerate(projection):
-        if value > threshold and start is None:
-            start = max(0, i - margin)
-        elif value <= threshold and start is not None:
-            end = min(image.shape[0], i + margin)
-            
-            roi = image[start:end, :]
-            
-            # Filtro de qualidade rigoroso
-            # Ignora manchas pequenas (<20px altura) ou sem tinta suficiente
-            if roi.shape[0] > 20 and roi.shape[1] > 50 and cv2.countNonZero(roi) > 100:
-                lines.append(cv2.bitwise_not(roi))
-            
-            start = None
-
-    if start is not None:
-        lines.append(cv2.bitwise_not(image[start:, :]))
-
-    return lines
\ No newline at end of file
+    return regions
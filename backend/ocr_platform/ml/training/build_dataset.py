@@ -1,88 +1,191 @@
 import sys
 import os
 sys.path.append(os.getcwd())
+import argparse
 import csv
+import hashlib
+import json
 import shutil
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
 from app.core.database import SessionLocal
 from app.models.correction import CorrecaoHumana
 from app.models.segment import OCRSegmento
-from sklearn.model_selection import train_test_split
+from app.services.segment_store import read_crop, media_type
 
+# Guarda a marca d'água (última correção exportada) do build incremental
+STATE_FILE = "build_state.json"
 
-def build_dataset(output_dir="data/dataset_v1", test_size=0.1):
+# O updated_at é a hora de INÍCIO da transação (now()): uma correção cuja transação começou
+# antes do último build mas só fez commit depois dele teria um updated_at abaixo da marca.
+# Cada build volta por isso a ler esta janela antes da marca (reexportar é inofensivo).
+RESCAN_MINUTES = 60
+
+
+def split_for(segment_id: int, test_size: float) -> str:
+    """
+    Split estável por hash do id do segmento: um exemplo nunca muda de treino para teste
+    (nem vice-versa) entre builds, mesmo com o dataset a crescer.
+    """
+    bucket = int(hashlib.sha1(str(segment_id).encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return "test" if bucket < test_size else "train"
+
+
+def load_state(output_dir):
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(output_dir, state):
+    tmp_path = os.path.join(output_dir, STATE_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, STATE_FILE))
+
+
+def load_csv(path):
+    """Lê um train.csv/test.csv existente: {file_name: text}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["file_name"]: row["text"] for row in csv.DictReader(f)}
+
+
+def export_image(segment, images_dir) -> str:
+    """
+    Coloca o recorte do segmento na pasta do dataset e devolve o nome do ficheiro.
+    O recorte de um segmento nunca muda, por isso só é escrito uma vez.
+    PNG antigos (ficheiro inteiro) entram por hardlink; recortes em pacote são extraídos.
+    """
+    if segment.imagem_offset is None:
+        filename = f"segment_{segment.id}{os.path.splitext(segment.imagem_path)[1]}"
+        target_path = os.path.join(images_dir, filename)
+        if not os.path.exists(target_path):
+            try:
+                os.link(segment.imagem_path, target_path)
+            except OSError:
+                # Outro disco/sistema de ficheiros: não dá para hardlink
+                shutil.copy2(segment.imagem_path, target_path)
+        return filename
+
+    data = read_crop(segment.imagem_path, segment.imagem_offset, segment.imagem_tamanho)
+    extension = ".webp" if media_type(data) == "image/webp" else ".png"
+    filename = f"segment_{segment.id}{extension}"
+    target_path = os.path.join(images_dir, filename)
+    if not os.path.exists(target_path):
+        with open(target_path, "wb") as f:
+            f.write(data)
+    return filename
+
+
+def build_dataset(output_dir="data/dataset_v1", test_size=0.1, full=False, rescan_minutes=RESCAN_MINUTES):
     """
     Exporta as correções humanas da BD para uma pasta de dataset organizada.
     Estrutura:
     /data/dataset_v1/
        /images/
-       metadata.csv (file_name, text)
+       train.csv / test.csv (file_name, text)
+       build_state.json (marca d'água do build incremental)
+
+    É incremental: só exporta as correções novas ou alteradas desde o último build
+    (mais uma janela de rescan_minutes antes da marca, ver RESCAN_MINUTES).
+    full=True reconstrói tudo do zero. Sem build_state.json (ex: um dataset antigo,
+    com outros nomes de ficheiro e split aleatório) também: juntar as linhas antigas
+    às novas duplicaria os exemplos e poria cópias do teste no treino.
+    O mesmo se o test_size for diferente do guardado no build anterior.
     """
     print(f"🔨 A construir dataset em '{output_dir}'...")
-    
+
+    images_dir = os.path.join(output_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+
+    train_csv = os.path.join(output_dir, "train.csv")
+    test_csv = os.path.join(output_dir, "test.csv")
+
+    state = {} if full else load_state(output_dir)
+    if not state:
+        if not full and (os.path.exists(train_csv) or os.path.exists(test_csv)):
+            print("⚠️ Dataset sem build_state.json: a reconstruir os CSV do zero.")
+        full = True
+    elif state.get("test_size") != test_size:
+        # Com outro test_size, o split de muitos segmentos antigos muda: reconstruir tudo
+        print(f"⚠️ test_size mudou ({state.get('test_size')} -> {test_size}): a reconstruir os CSV do zero.")
+        state, full = {}, True
+    watermark = state.get("watermark")
+    splits = {
+        "train": {} if full else load_csv(train_csv),
+        "test": {} if full else load_csv(test_csv),
+    }
+
     db = SessionLocal()
-    
-    # 1. Buscar todas as correções humanas
-    # Fazemos join com o Segmento para saber qual é a imagem
-    corrections = db.query(CorrecaoHumana, OCRSegmento)\
-        .join(OCRSegmento, CorrecaoHumana.segmento_id == OCRSegmento.id)\
-        .all()
+    try:
+        # 1. Buscar as correções alteradas desde a marca d'água (menos a janela de rescan,
+        # para apanhar as que fizeram commit tarde; reexportar é inofensivo)
+        query = db.query(CorrecaoHumana, OCRSegmento)\
+            .join(OCRSegmento, CorrecaoHumana.segmento_id == OCRSegmento.id)
+        if watermark:
+            since = datetime.fromisoformat(watermark) - timedelta(minutes=rescan_minutes)
+            query = query.filter(CorrecaoHumana.updated_at >= since)
+        corrections = query.order_by(CorrecaoHumana.updated_at, CorrecaoHumana.id).all()
 
-    if not corrections:
-        print("⚠️ Nenhuma correção encontrada na base de dados. Valida alguns segmentos primeiro!")
-        return
+        if not corrections:
+            print("✅ Nenhuma correção nova desde o último build.")
+            return
 
-    print(f"📚 Encontrados {len(corrections)} exemplos validados.")
+        print(f"📚 Encontradas {len(corrections)} correções novas ou alteradas.")
 
-    # 2. Preparar pastas
-    images_dir = os.path.join(output_dir, "images")
-    os.makedirs(images_dir, exist_ok=True)
+        # 2. Só a correção mais recente de cada segmento (a última pela ordem da query)
+        latest = {segment.id: (correction, segment) for correction, segment in corrections}
 
-    data_entries = []
+        # 3. Exportar cada segmento para o split fixo dele
+        exported = 0
+        for correction, segment in latest.values():
+            if not os.path.exists(segment.imagem_path):
+                print(f"❌ Imagem não encontrada: {segment.imagem_path} (saltando...)")
+                continue
 
-    # 3. Processar cada correção
-    for correction, segment in corrections:
-        # Nome do ficheiro original
-        original_path = segment.imagem_path
-        
-        if not os.path.exists(original_path):
-            print(f"❌ Imagem não encontrada: {original_path} (saltando...)")
-            continue
+            filename = export_image(segment, images_dir)
+            split = split_for(segment.id, test_size)
+            # Um ficheiro nunca fica nos dois splits (ex: CSV escritos por uma versão anterior)
+            splits["test" if split == "train" else "train"].pop(filename, None)
+            splits[split][filename] = correction.texto_corrigido
+            exported += 1
 
-        # Copiar imagem para a pasta do dataset (para ficar tudo junto)
-        filename = os.path.basename(original_path)
-        target_path = os.path.join(images_dir, filename)
-        shutil.copy2(original_path, target_path)
-
-        # Adicionar à lista
-        data_entries.append({
-            "file_name": filename,
-            "text": correction.texto_corrigido
-        })
-
-    # 4. Dividir em Treino e Teste (90% aprender, 10% validar)
-    # Se houver poucos dados, usamos tudo para treino
-    if len(data_entries) > 5:
-        train_data, test_data = train_test_split(data_entries, test_size=test_size, random_state=42)
-    else:
-        train_data = data_entries
-        test_data = []
-
-    # 5. Guardar metadados (CSV)
-    save_csv(train_data, os.path.join(output_dir, "train.csv"))
-    save_csv(test_data, os.path.join(output_dir, "test.csv"))
-    
-    print(f"✅ Dataset construído com sucesso!")
-    print(f"   - Treino: {len(train_data)} exemplos")
-    print(f"   - Teste: {len(test_data)} exemplos")
+        # A marca nunca recua (as correções relidas na janela são mais antigas que ela)
+        new_watermark = max(correction.updated_at for correction, _ in corrections)
+        if watermark:
+            new_watermark = max(new_watermark, datetime.fromisoformat(watermark))
+    finally:
+        db.close()
+
+    # 4. Guardar metadados (CSV) e só depois a marca d'água
+    save_csv(splits["train"], train_csv)
+    save_csv(splits["test"], test_csv)
+    save_state(output_dir, {"watermark": new_watermark.isoformat(), "test_size": test_size})
+
+    print(f"✅ Dataset atualizado com sucesso! ({exported} exemplos exportados)")
+    print(f"   - Treino: {len(splits['train'])} exemplos")
+    print(f"   - Teste: {len(splits['test'])} exemplos")
 
 def save_csv(data, path):
-    with open(path, "w", newline="", encoding="utf-8") as f:
+    """Grava {file_name: text} de forma atómica (temporário + rename)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(["file_name", "text"])
-        for item in data:
-            writer.writerow([item["file_name"], item["text"]])
+        for file_name, text in sorted(data.items()):
+            writer.writerow([file_name, text])
+    os.replace(tmp_path, path)
 
 if __name__ == "__main__":
-    # Precisamos instalar scikit-learn: pip install scikit-learn
-    build_dataset()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Exporta as correções humanas para um dataset de treino.")
+    parser.add_argument("--output-dir", default="data/dataset_v1")
+    parser.add_argument("--test-size", type=float, default=0.1)
+    parser.add_argument("--full", action="store_true", help="Ignorar a marca d'água e reconstruir tudo")
+    parser.add_argument("--rescan-minutes", type=int, default=RESCAN_MINUTES,
+                        help="Janela antes da marca d'água que é sempre relida (commits tardios)")
+    args = parser.parse_args()
+
+    build_dataset(args.output_dir, args.test_size, args.full, args.rescan_minutes)
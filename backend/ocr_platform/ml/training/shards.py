@@ -0,0 +1,161 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+SHARDS_DIR = "data/shards"
+
+# Nº de exemplos por shard (~450 MB de píxeis uint8 a 384x384)
+SHARD_SIZE = 1024
+
+
+def dataset_version(csv_path: str, processor, max_target_length: int) -> str:
+    """
+    Versão do dataset: hash do CSV e da configuração do processador.
+    Os recortes de um segmento nunca mudam, por isso o CSV identifica o conteúdo.
+    """
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        digest.update(f.read())
+    digest.update(json.dumps(processor.image_processor.to_dict(), sort_keys=True, default=str).encode())
+    digest.update(f"{processor.tokenizer.name_or_path}|{max_target_length}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _read_rows(csv_path: str):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return [row for row in csv.DictReader(f) if row["file_name"] and row["text"]]
+
+
+def build_shards(csv_path: str, images_dir: str, processor, max_target_length: int = 128,
+                 shards_dir: str = SHARDS_DIR, shard_size: int = SHARD_SIZE) -> str:
+    """
+    Pré-processa o dataset UMA vez para shards em disco (lidos com memory-map):
+    - pixels.npy: imagens já redimensionadas pelo processador, em uint8 (N, 3, H, W)
+      (a normalização é só aritmética e faz-se ao ler: 4x menos disco que float32)
+    - tokens.npy + offsets.npy: ids dos tokens sem padding (concatenados)
+    Se já existirem shards desta versão, reaproveita-os. Devolve a pasta dos shards.
+    """
+    version = dataset_version(csv_path, processor, max_target_length)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    output_dir = os.path.join(shards_dir, f"{name}_{version}")
+    if os.path.exists(os.path.join(output_dir, "manifest.json")):
+        print(f"♻️ Shards já existentes em '{output_dir}'")
+        return output_dir
+
+    rows = _read_rows(csv_path)
+    print(f"📦 A criar shards de {len(rows)} exemplos em '{output_dir}'...")
+
+    tmp_dir = output_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    image_processor = processor.image_processor
+    shards = []
+    for shard_index, start in enumerate(range(0, len(rows), shard_size)):
+        chunk = rows[start:start + shard_size]
+        shard_name = f"shard_{shard_index:05d}"
+        pixels = None
+        tokens, offsets = [], [0]
+
+        for i, row in enumerate(chunk):
+            image = Image.open(os.path.join(images_dir, row["file_name"])).convert("RGB")
+            resized = image_processor(
+                image, do_rescale=False, do_normalize=False, return_tensors="np"
+            ).pixel_values[0]
+            if pixels is None:
+                pixels = np.lib.format.open_memmap(
+                    os.path.join(tmp_dir, f"{shard_name}_pixels.npy"), mode="w+",
+                    dtype=np.uint8, shape=(len(chunk),) + resized.shape
+                )
+            pixels[i] = np.clip(np.rint(resized), 0, 255).astype(np.uint8)
+
+            ids = processor.tokenizer(row["text"], max_length=max_target_length, truncation=True).input_ids
+            tokens.extend(ids)
+            offsets.append(len(tokens))
+
+        pixels.flush()
+        del pixels
+        np.save(os.path.join(tmp_dir, f"{shard_name}_tokens.npy"), np.asarray(tokens, dtype=np.int32))
+        np.save(os.path.join(tmp_dir, f"{shard_name}_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        shards.append({"name": shard_name, "count": len(chunk)})
+
+    manifest = {
+        "version": version,
+        "csv": csv_path,
+        "count": len(rows),
+        "shards": shards,
+        "image_mean": list(image_processor.image_mean),
+        "image_std": list(image_processor.image_std),
+        "rescale_factor": image_processor.rescale_factor,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Só fica visível quando estiver completo
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return output_dir
+
+
+class ShardDataset(Dataset):
+    """
+    Lê os exemplos dos shards por memory-map: sem descodificar PNG nem tokenizar em cada época.
+    Os ficheiros só são abertos no primeiro acesso, já dentro de cada processo do DataLoader.
+    """
+    def __init__(self, shard_dir: str, indices=None):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        # Índice global -> (shard, posição no shard)
+        self.locations = [
+            (shard_index, position)
+            for shard_index, shard in enumerate(self.manifest["shards"])
+            for position in range(shard["count"])
+        ]
+        if indices is not None:
+            self.locations = [self.locations[i] for i in indices]
+
+        self.scale = self.manifest["rescale_factor"]
+        self.mean = torch.tensor(self.manifest["image_mean"]).view(-1, 1, 1)
+        self.std = torch.tensor(self.manifest["image_std"]).view(-1, 1, 1)
+        self._arrays = None
+
+    def _open(self):
+        self._arrays = [
+            tuple(
+                np.load(os.path.join(self.shard_dir, f"{shard['name']}_{kind}.npy"), mmap_mode="r")
+                for kind in ("pixels", "tokens", "offsets")
+            )
+            for shard in self.manifest["shards"]
+        ]
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __getitem__(self, idx):
+        if self._arrays is None:
+            self._open()
+        shard_index, position = self.locations[idx]
+        pixels, tokens, offsets = self._arrays[shard_index]
+
+        pixel_values = torch.from_numpy(np.array(pixels[position], dtype=np.float32))
+        pixel_values = (pixel_values * self.scale - self.mean) / self.std
+        labels = torch.from_numpy(np.array(tokens[offsets[position]:offsets[position + 1]], dtype=np.int64))
+        return {"pixel_values": pixel_values, "labels": labels}
+
+
+def collate_batch(batch):
+    """Padding dinâmico: as labels só são preenchidas (com -100) até à maior do lote."""
+    pixel_values = torch.stack([item["pixel_values"] for item in batch])
+    labels = torch.nn.utils.rnn.pad_sequence(
+        [item["labels"] for item in batch], batch_first=True, padding_value=-100
+    )
+    return {"pixel_values": pixel_values, "labels": labels}
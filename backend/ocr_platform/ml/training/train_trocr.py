@@ -4,69 +4,191 @@ import os
 # Adiciona a raiz do projeto ao path (para evitar erros de módulo)
 sys.path.append(os.getcwd())
 
-import pandas as pd
+import argparse
+import csv
+import hashlib
+import json
+import random
+import shutil
+from contextlib import nullcontext
+
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import DataLoader
 from torch.optim import AdamW  # <--- MUDANÇA AQUI: Importar do PyTorch
-from PIL import Image
 from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from tqdm import tqdm
+from jiwer import cer
+from ml.inference.registry import MODELS_DIR, new_version_dir, promote, resolve_current_model
+from ml.training.shards import build_shards, ShardDataset, collate_batch
+
+# --- Configurações ---
+DATASET_DIR = "data/dataset_v1"
+IMAGES_DIR = os.path.join(DATASET_DIR, "images")
+TRAIN_CSV = os.path.join(DATASET_DIR, "train.csv")
+
+# Treinos em curso (checkpoints para retomar): models/ocr/training/<versão>/
+TRAINING_DIR = os.path.join(MODELS_DIR, "training")
+# Cada versão treinada guarda os exemplos que já viu, {ficheiro: texto} (para o próximo treino incremental)
+SEEN_FILE = "trained_examples.json"
+
+# Parâmetros de Treino
+BATCH_SIZE = 2
+# Acumulação de gradientes: lote efetivo = BATCH_SIZE * ACCUMULATION_STEPS
+ACCUMULATION_STEPS = 8
+EPOCHS = 10
+LEARNING_RATE = 5e-5
+MAX_TARGET_LENGTH = 128
+# Processos do DataLoader (os shards são lidos por memory-map, sem copiar para cada processo)
+LOADER_WORKERS = min(4, os.cpu_count() or 1)
+
+# Exemplos antigos misturados com os novos (evita "esquecer" o que já sabia)
+REPLAY_RATIO = 1.0
+MIN_REPLAY = 200
+# Fração do train.csv separada para validação (CER no fim de cada época, early stopping e
+# promoção). O test.csv fica só para a avaliação final (ml/evaluation/evaluete.py)
+VAL_FRACTION = 0.05
+# Nº máximo de exemplos de validação usados para medir o CER
+VAL_MAX_EXAMPLES = 500
+# Parar se o CER de validação não melhorar durante PATIENCE épocas seguidas
+PATIENCE = 2
+# Gravar um checkpoint (modelo + otimizador) a cada N passos do otimizador
+CHECKPOINT_STEPS = 200
+# bf16 (autocast) no CPU e nas GPUs que o suportam
+USE_BF16 = os.getenv("TRAIN_BF16", "true").lower() in ("1", "true", "yes")
+SEED = 42
+
+
+def read_rows(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row for row in csv.DictReader(f) if row["file_name"] and row["text"]]
+
+
+def write_rows(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_name", "text"])
+        for row in rows:
+            writer.writerow([row["file_name"], row["text"]])
+
+
+def is_validation(file_name: str) -> bool:
+    """Split estável por hash do nome do ficheiro: um exemplo de validação nunca é treinado."""
+    bucket = int(hashlib.sha1(file_name.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return bucket < VAL_FRACTION
+
+
+def read_seen(model_path):
+    """Exemplos já usados para treinar o modelo atual (vazio para o modelo base)."""
+    path = os.path.join(model_path, SEEN_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def select_examples(rows, seen, full=False):
+    """
+    Treino incremental: todos os exemplos novos (ou com texto alterado)
+    e uma amostra dos antigos (replay). full=True usa tudo.
+    """
+    if full or not seen:
+        return rows, len(rows)
+
+    new = [row for row in rows if seen.get(row["file_name"]) != row["text"]]
+    old = [row for row in rows if seen.get(row["file_name"]) == row["text"]]
+    replay = max(MIN_REPLAY, int(REPLAY_RATIO * len(new)))
+    replay_rows = random.Random(SEED).sample(old, min(replay, len(old)))
+    return new + replay_rows, len(new)
+
+
+def autocast(device):
+    if not USE_BF16:
+        return nullcontext()
+    if device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        return nullcontext()
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
+
+def evaluate_cer(model, processor, dataloader, device):
+    """CER (greedy) no conjunto de validação. As referências vêm das próprias labels."""
+    if dataloader is None:
+        return None
+
+    model.eval()
+    predictions, references = [], []
+    with torch.inference_mode(), autocast(device):
+        for batch in dataloader:
+            generated = model.generate(batch["pixel_values"].to(device), max_new_tokens=MAX_TARGET_LENGTH)
+            predictions.extend(processor.batch_decode(generated, skip_special_tokens=True))
+            labels = batch["labels"].clone()
+            labels[labels == -100] = processor.tokenizer.pad_token_id
+            references.extend(processor.batch_decode(labels, skip_special_tokens=True))
+    model.train()
+    return cer(references, predictions)
+
+
+def save_checkpoint(run_dir, model, optimizer, state):
+    """Grava modelo, otimizador e progresso de forma atómica (um crash nunca deixa um checkpoint a meio)."""
+    path = os.path.join(run_dir, "checkpoint.pt")
+    tmp_path = path + ".tmp"
+    torch.save({
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "rng": torch.get_rng_state(),
+        "state": state,
+    }, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def find_unfinished_run():
+    """Último treino interrompido (com checkpoint), ou None."""
+    if not os.path.isdir(TRAINING_DIR):
+        return None
+    runs = [
+        os.path.join(TRAINING_DIR, name) for name in sorted(os.listdir(TRAINING_DIR))
+        if os.path.exists(os.path.join(TRAINING_DIR, name, "checkpoint.pt"))
+    ]
+    return runs[-1] if runs else None
 
-class OCRDataset(Dataset):
-    """Classe que carrega as imagens e textos para o PyTorch"""
-    def __init__(self, root_dir, df, processor, max_target_length=128):
-        self.root_dir = root_dir
-        self.df = df
-        self.processor = processor
-        self.max_target_length = max_target_length
-
-    def __len__(self):
-        return len(self.df)
-
-    def __getitem__(self, idx):
-        # Ler nome do ficheiro e texto do CSV
-        file_name = self.df.iloc[idx]['file_name']
-        text = str(self.df.iloc[idx]['text']) # Garantir que é string
-        
-        # Carregar imagem
-        image_path = os.path.join(self.root_dir, file_name)
-        # Importante: converter para RGB
-        image = Image.open(image_path).convert("RGB")
-        
-        # Preparar imagem (converter para números/tensores)
-        pixel_values = self.processor(image, return_tensors="pt").pixel_values
-        
-        # Preparar texto (converter para IDs de tokens)
-        labels = self.processor.tokenizer(
-            text, 
-            padding="max_length", 
-            max_length=self.max_target_length,
-            truncation=True # Importante para evitar erros de tamanho
-        ).input_ids
-        
-        # Substituir o token de padding por -100
-        labels = [label if label != self.processor.tokenizer.pad_token_id else -100 for label in labels]
-
-        encoding = {"pixel_values": pixel_values.squeeze(), "labels": torch.tensor(labels)}
-        return encoding
-
-def train():
-    # --- Configurações ---
-    DATASET_DIR = "data/dataset_v1"
-    IMAGES_DIR = os.path.join(DATASET_DIR, "images")
-    TRAIN_CSV = os.path.join(DATASET_DIR, "train.csv")
-    
-    # Modelo base
-    MODEL_NAME = "microsoft/trocr-base-handwritten"
-    
-    # Onde guardar o modelo afinado
-    OUTPUT_DIR = "models/ocr/trocr_finetuned_v1"
-    
-    # Parâmetros de Treino
-    BATCH_SIZE = 2    
-    EPOCHS = 10       
-    LEARNING_RATE = 5e-5
-    
+
+def prepare_run(full=False):
+    """
+    Novo treino: parte do modelo em produção, escolhe os exemplos (novos + replay)
+    e grava tudo o que é preciso para retomar em models/ocr/training/<versão>/.
+    """
+    start_version, start_path = resolve_current_model()
+    all_rows = read_rows(TRAIN_CSV)
+    rows = [row for row in all_rows if not is_validation(row["file_name"])]
+    validation = [row for row in all_rows if is_validation(row["file_name"])]
+    seen = read_seen(start_path)
+    selected, new_count = select_examples(rows, seen, full)
+
+    if new_count == 0:
+        return None
+
+    version, output_dir = new_version_dir()
+    run_dir = os.path.join(TRAINING_DIR, version)
+    os.makedirs(run_dir, exist_ok=True)
+
+    write_rows(selected, os.path.join(run_dir, "selection.csv"))
+    write_rows(validation[:VAL_MAX_EXAMPLES], os.path.join(run_dir, "validation.csv"))
+
+    run = {
+        "version": version,
+        "output_dir": output_dir,
+        "start_version": start_version,
+        "start_path": start_path,
+        "new_examples": new_count,
+        "seen": {**seen, **{row["file_name"]: row["text"] for row in rows}},
+    }
+    with open(os.path.join(run_dir, "run.json"), "w", encoding="utf-8") as f:
+        json.dump(run, f)
+    return run_dir
+
+
+def train(resume=False, full=False):
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"🚀 A iniciar treino em: {device}")
 
@@ -75,19 +197,34 @@ def train():
         print("❌ Ficheiro train.csv não encontrado. Corre o build_dataset.py primeiro.")
         return
 
-    train_df = pd.read_csv(TRAIN_CSV)
-    train_df = train_df.dropna()
-    print(f"📚 Exemplos de treino válidos: {len(train_df)}")
+    run_dir = find_unfinished_run() if resume else None
+    if run_dir:
+        print(f"⏯️ A retomar o treino em '{run_dir}'...")
+    else:
+        run_dir = prepare_run(full)
+        if run_dir is None:
+            print("✅ Nenhum exemplo novo desde o último treino. Nada a fazer.")
+            return
 
-    if len(train_df) == 0:
+    with open(os.path.join(run_dir, "run.json"), encoding="utf-8") as f:
+        run = json.load(f)
+    VERSION, OUTPUT_DIR = run["version"], run["output_dir"]
+
+    # 2. Preparar Modelo e Processador (continua a partir do modelo em produção)
+    print(f"🧠 A carregar modelo TrOCR '{run['start_version']}'...")
+    processor = TrOCRProcessor.from_pretrained(run["start_path"])
+    model = VisionEncoderDecoderModel.from_pretrained(run["start_path"])
+
+    # Imagens e textos pré-processados uma só vez (só os exemplos escolhidos: o custo
+    # cresce com os dados novos, não com todo o histórico)
+    train_dataset = ShardDataset(build_shards(os.path.join(run_dir, "selection.csv"), IMAGES_DIR, processor, MAX_TARGET_LENGTH))
+    val_dataset = ShardDataset(build_shards(os.path.join(run_dir, "validation.csv"), IMAGES_DIR, processor, MAX_TARGET_LENGTH))
+    print(f"📚 Exemplos de treino: {len(train_dataset)} ({run['new_examples']} novos + replay)")
+
+    if len(train_dataset) == 0:
         print("⚠️ O dataset está vazio!")
         return
 
-    # 2. Preparar Modelo e Processador
-    print("🧠 A carregar modelo TrOCR...")
-    processor = TrOCRProcessor.from_pretrained(MODEL_NAME)
-    model = VisionEncoderDecoderModel.from_pretrained(MODEL_NAME)
-    
     # Configurações técnicas
     model.config.decoder_start_token_id = processor.tokenizer.cls_token_id
     model.config.pad_token_id = processor.tokenizer.pad_token_id
@@ -95,43 +232,111 @@ def train():
 
     model.to(device)
 
-    # 3. Criar DataLoader
-    train_dataset = OCRDataset(root_dir=IMAGES_DIR, df=train_df, processor=processor)
-    train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
+    val_dataloader = DataLoader(
+        val_dataset, batch_size=BATCH_SIZE * 4, collate_fn=collate_batch, num_workers=LOADER_WORKERS
+    ) if len(val_dataset) else None
 
-    # 4. Otimizador (Agora usa o do PyTorch)
+    # 3. Otimizador (Agora usa o do PyTorch)
     optimizer = AdamW(model.parameters(), lr=LEARNING_RATE)
 
-    # 5. Loop de Treino
+    state = {"epoch": 0, "batch": 0, "step": 0, "best_cer": None, "baseline_cer": None, "bad_epochs": 0}
+    checkpoint_path = os.path.join(run_dir, "checkpoint.pt")
+    if os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location=device)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        torch.set_rng_state(checkpoint["rng"])
+        state = checkpoint["state"]
+        print(f"   Época {state['epoch'] + 1}, lote {state['batch']} (passo {state['step']})")
+    else:
+        # CER do modelo de partida: a versão nova só vai para produção se for melhor
+        state["baseline_cer"] = evaluate_cer(model, processor, val_dataloader, device)
+        if state["baseline_cer"] is not None:
+            print(f"📏 CER do modelo atual: {state['baseline_cer']:.4f}")
+        save_checkpoint(run_dir, model, optimizer, state)
+
+    # 4. Loop de Treino
     model.train()
-    
-    for epoch in range(EPOCHS):
+
+    while state["epoch"] < EPOCHS:
+        epoch = state["epoch"]
+
+        # Ordem dos exemplos fixa por época: ao retomar, salta os lotes já feitos
+        order = torch.randperm(len(train_dataset), generator=torch.Generator().manual_seed(SEED + epoch)).tolist()
+        train_dataloader = DataLoader(
+            train_dataset,
+            batch_size=BATCH_SIZE,
+            sampler=order[state["batch"] * BATCH_SIZE:],
+            collate_fn=collate_batch,
+            num_workers=LOADER_WORKERS,
+        )
+
         total_loss = 0
         progress_bar = tqdm(train_dataloader, desc=f"Epoch {epoch+1}/{EPOCHS}")
-        
-        for batch in progress_bar:
+        optimizer.zero_grad()
+
+        for i, batch in enumerate(progress_bar, start=1):
             pixel_values = batch["pixel_values"].to(device)
             labels = batch["labels"].to(device)
 
-            outputs = model(pixel_values=pixel_values, labels=labels)
+            with autocast(device):
+                outputs = model(pixel_values=pixel_values, labels=labels)
             loss = outputs.loss
-
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+            (loss / ACCUMULATION_STEPS).backward()
 
             total_loss += loss.item()
             progress_bar.set_postfix({'loss': loss.item()})
-        
-        avg_loss = total_loss / len(train_dataloader)
-        print(f"📉 Epoch {epoch+1} | Média Loss: {avg_loss:.4f}")
-
-    # 6. Guardar o Modelo
-    print(f"💾 A guardar o novo modelo em '{OUTPUT_DIR}'...")
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    model.save_pretrained(OUTPUT_DIR)
-    processor.save_pretrained(OUTPUT_DIR)
+            state["batch"] += 1
+
+            if i % ACCUMULATION_STEPS == 0 or i == len(train_dataloader):
+                optimizer.step()
+                optimizer.zero_grad()
+                state["step"] += 1
+                if state["step"] % CHECKPOINT_STEPS == 0:
+                    save_checkpoint(run_dir, model, optimizer, state)
+
+        avg_loss = total_loss / max(1, len(train_dataloader))
+        val_cer = evaluate_cer(model, processor, val_dataloader, device)
+        print(f"📉 Epoch {epoch+1} | Média Loss: {avg_loss:.4f}" + (f" | CER: {val_cer:.4f}" if val_cer is not None else ""))
+
+        # 5. Guardar o melhor modelo até agora (early stopping pelo CER de validação)
+        if val_cer is None or state["best_cer"] is None or val_cer < state["best_cer"]:
+            state["best_cer"] = val_cer
+            state["bad_epochs"] = 0
+            print(f"💾 A guardar o novo modelo em '{OUTPUT_DIR}'...")
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            model.save_pretrained(OUTPUT_DIR)
+            processor.save_pretrained(OUTPUT_DIR)
+            with open(os.path.join(OUTPUT_DIR, SEEN_FILE), "w", encoding="utf-8") as f:
+                json.dump(run["seen"], f)
+        else:
+            state["bad_epochs"] += 1
+
+        state["epoch"] += 1
+        state["batch"] = 0
+        save_checkpoint(run_dir, model, optimizer, state)
+
+        if state["bad_epochs"] >= PATIENCE:
+            print(f"⏹️ CER sem melhorias há {PATIENCE} épocas. A parar.")
+            break
+
+    # Treino terminado: já não é preciso retomar
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+    baseline, best = state["baseline_cer"], state["best_cer"]
+    if baseline is not None and best is not None and best > baseline:
+        print(f"⚠️ O modelo novo (CER {best:.4f}) é pior que o atual ({baseline:.4f}). Não foi promovido.")
+        return
+
+    # Só depois de tudo gravado é que a versão vai para produção
+    # (os workers trocam de modelo a quente, sem reiniciar)
+    promote(VERSION)
     print("✅ Treino concluído com sucesso!")
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Afina o TrOCR com as correções humanas (incremental).")
+    parser.add_argument("--resume", action="store_true", help="Retomar o último treino interrompido")
+    parser.add_argument("--full", action="store_true", help="Treinar com todos os exemplos (não só os novos + replay)")
+    args = parser.parse_args()
+
+    train(resume=args.resume, full=args.full)
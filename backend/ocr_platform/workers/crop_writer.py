@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from app.core.config import CROP_WRITE_THREADS
+from app.core.metrics import stage
+from app.services.segment_store import SegmentPack, encode_crop
+
+
+def _encode(image) -> bytes:
+    with stage("image_encode"):
+        return encode_crop(image)
+
+
+class CropBatch:
+    """
+    Recortes de UMA página. Uso:
+        crops = crop_writer.batch(document_id)
+        i = crops.add(imagem)          # codifica em fundo, enquanto corre a inferência
+        locations = crops.wait(keep)   # antes do commit: grava no pacote os índices em 'keep'
+        crops.discard()                # se a página falhar: cancela as codificações pendentes
+    """
+    def __init__(self, executor: ThreadPoolExecutor, document_id: int):
+        self.executor = executor
+        self.pack = SegmentPack(document_id)
+        self.futures = []
+
+    @property
+    def path(self) -> str:
+        return self.pack.path
+
+    def add(self, image) -> int:
+        self.futures.append(self.executor.submit(_encode, image))
+        return len(self.futures) - 1
+
+    def wait(self, keep) -> dict:
+        """
+        Espera pelas codificações (lança o primeiro erro) e acrescenta ao pacote,
+        por ordem, os recortes em 'keep'. Devolve {índice: (offset, tamanho)}.
+        """
+        keep = sorted(keep)
+        blobs = [self.futures[i].result() for i in keep]
+        with stage("image_write"):
+            return dict(zip(keep, self.pack.append_many(blobs)))
+
+    def discard(self):
+        for future in self.futures:
+            future.cancel()
+        wait(self.futures)
+
+
+class CropWriter:
+    """
+    Pool de threads que codifica os recortes das linhas em fundo.
+    O cv2.imencode liberta o GIL, por isso sobrepõe-se à inferência
+    do TrOCR na thread principal.
+    """
+    def __init__(self, threads: int = CROP_WRITE_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="crop-writer")
+
+    def batch(self, document_id: int) -> CropBatch:
+        return CropBatch(self.executor, document_id)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
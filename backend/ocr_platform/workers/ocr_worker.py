@@ -5,124 +5,361 @@ import time
 # Adiciona o diretório raiz ao path
 sys.path.append(os.getcwd())
 
-from ml.preprocessing.image import preprocess_image, segment_lines
-from ml.inference.trocr import run_trocr
+from ml.preprocessing.image import count_pages
+from ml.inference.client import read_lines, cache_stats
 from app.models.ocr import OCRResultado
 from app.models.segment import OCRSegmento
 from app.models.document import Document
-from app.core.database import SessionLocal
-import uuid
-import cv2
-
-def process_document(document_id: int):
-    print(f"▶️ A iniciar processamento do documento {document_id}...")
-    db = SessionLocal()
-    
-    try:
-        document = db.get(Document, document_id)
-        
-        if not document:
-            print(f"❌ Documento {document_id} não encontrado.")
-            return
+from app.core.database import SessionFactory
+from app.core.config import WORKER_IDLE_TIMEOUT, WORKER_METRICS_PORT, WORKER_METRICS_PORTS
+from app.core.metrics import (
+    stage, observe_stages, STAGE_SECONDS, DOCUMENTS_PROCESSED,
+    PAGES_PROCESSED, LINES_PROCESSED, QUEUE_DEPTH, start_metrics_server
+)
+from app.services.queue import (
+    make_worker_id, claim_next_document, count_pending_documents, fenced_update,
+    release_duplicates, LeaseHeartbeat, LeaseLost, QueueListener
+)
+from workers.pipeline import create_preprocess_pool, iter_prepared_pages
+from workers.crop_writer import CropWriter
+from sqlalchemy import insert
+from sqlalchemy.sql import func
 
-        # Bloquear o documento (status 'processing') para ninguém mais mexer
-        document.status = "processing"
-        db.commit()
+# Gravação dos recortes em fundo (partilhada por todos os documentos do worker)
+crop_writer = CropWriter()
+
+def stitch_text(regions, results) -> str:
+    """
+    Reconstrói o texto da página: pedaços da mesma linha juntam-se por ordem de x,
+    e as linhas por ordem de aparecimento.
+    """
+    lines = {}
+    for region, (text, _) in zip(regions, results):
+        if text.strip():
+            lines.setdefault(region["linha"], []).append((region["bbox"][0], text))
+    return "\n".join(
+        " ".join(text for _, text in sorted(chunks))
+        for _, chunks in sorted(lines.items())
+    )
+
+def process_page(db, document_id: int, page_number: int, regions, worker_id: str = None) -> str:
+    """
+    Lê as regiões (linhas ou pedaços de linha já segmentados) de uma página,
+    guardando um OCRResultado só para ela.
+    A página é atómica: o resultado e todos os segmentos entram num só commit
+    (um INSERT para todos os segmentos); se algo falhar, nada fica na BD
+    e os recortes já escritos no pacote ficam órfãos (nenhum segmento aponta para eles).
+    O commit só acontece se o documento ainda for deste worker (LeaseLost se não for).
+    """
+    print(f"   ✂️ Página {page_number}: {len(regions)} segmentos.")
+
+    # Os recortes (para validação no frontend) são codificados em fundo durante a inferência
+    crops = crop_writer.batch(document_id)
+    try:
+        for region in regions:
+            crops.add(region["image"])
 
-        print(f"   📂 Ficheiro: {document.storage_path}")
+        # Leitura com IA: todas as linhas da página em lotes (muito mais rápido em CPU),
+        # neste processo ou no servidor de inferência da máquina (INFERENCE_SOCKET).
+        # A página inteira é lida com a mesma versão do modelo (mesmo com troca a quente)
+        # Recortes já lidos antes (cabeçalhos de formulários, re-uploads) vêm da cache
+        start = time.perf_counter()
+        model_version, results = read_lines([region["image"] for region in regions])
+        elapsed = time.perf_counter() - start
+        # Cada linha só tem texto quando a página inteira volta: a latência de uma linha é esta;
+        # o débito (linhas/s) tira-se de LINES_PROCESSED
+        STAGE_SECONDS.labels("inference").observe(elapsed)
+        LINES_PROCESSED.inc(len(regions))
 
-        # 1. Pré-processamento (Limpeza e Segmentação)
-        # O teu image.py já tem a limpeza de fundo e rotação automática
-        image = preprocess_image(document.storage_path)
-        lines = segment_lines(image)
-        print(f"   ✂️ Documento segmentado em {len(lines)} linhas.")
+        # Só as linhas com texto viram segmentos
+        kept = [
+            (i, region, text, confidence)
+            for i, (region, (text, confidence)) in enumerate(zip(regions, results))
+            if text.strip()
+        ]
+        confidences = [confidence for _, _, _, confidence in kept]
 
-        # 2. Criar registo de OCR
         ocr_result = OCRResultado(
-            document_id=document.id,
-            texto_completo="",
-            confidence_global=0.0
+            document_id=document_id,
+            pagina=page_number,
+            model_version=model_version,
+            texto_completo=stitch_text(regions, results),
+            confidence_global=sum(confidences) / len(confidences) if confidences else 0.0
         )
-        db.add(ocr_result)
-        db.commit()
-        db.refresh(ocr_result)
 
-        full_text = []
-        
-        os.makedirs("segments", exist_ok=True)
+        with stage("image_write_wait"):
+            locations = crops.wait(keep=[i for i, _, _, _ in kept])
 
-        # 3. Leitura com IA
-        print("   🧠 A ler linhas com TrOCR...")
-        for i, line in enumerate(lines):
-            try:
-                # O run_trocr agora já carrega o teu modelo fino automaticamente!
-                text = run_trocr(line)
-                
-                if not text.strip():
-                    continue
-
-                full_text.append(text)
-
-                # Guardar o recorte para validação no frontend
-                seg_filename = f"segments/{document.id}_{i}_{uuid.uuid4().hex[:6]}.png"
-                cv2.imwrite(seg_filename, line)
-
-                segment = OCRSegmento(
-                    ocr_resultado_id=ocr_result.id,
-                    imagem_path=seg_filename,
-                    texto_previsto=text,
-                    confidence=1.0 
-                )
-                db.add(segment)
-                
-            except Exception as e:
-                print(f"   ⚠️ Erro na linha {i}: {e}")
+        with stage("db_write"):
+            db.add(ocr_result)
+            db.flush()
 
-        # 4. Finalizar
-        ocr_result.texto_completo = "\n".join(full_text)
-        ocr_result.confidence_global = 1.0
-        
-        document.status = "ocr_completed"
-        db.commit()
-        print(f"✅ Documento {document_id} concluído com sucesso!")
+            if kept:
+                db.execute(insert(OCRSegmento).values([
+                    {
+                        "ocr_resultado_id": ocr_result.id,
+                        "pagina": page_number,
+                        "linha": region["linha"],
+                        "bbox_x": region["bbox"][0],
+                        "bbox_y": region["bbox"][1],
+                        "bbox_w": region["bbox"][2],
+                        "bbox_h": region["bbox"][3],
+                        "imagem_path": crops.path,
+                        "imagem_offset": locations[i][0],
+                        "imagem_tamanho": locations[i][1],
+                        "texto_previsto": text,
+                        "confidence": confidence,
+                    }
+                    for i, region, text, confidence in kept
+                ]))
+
+            # Fencing: se a lease expirou e outro worker ficou com o documento, nada é gravado
+            fenced_update(db, document_id, worker_id, {
+                Document.paginas_processadas: func.coalesce(Document.paginas_processadas, 0) + 1
+            })
+            db.commit()
+    except BaseException:
+        db.rollback()
+        crops.discard()
+        raise
 
-    except Exception as e:
-        print(f"❌ Erro crítico ao processar {document_id}: {e}")
-        # Marcar como erro para não ficar preso em 'processing' para sempre
+    PAGES_PROCESSED.inc()
+    return ocr_result.texto_completo
+
+class DocumentRun:
+    """
+    Um documento reservado por este worker, do arranque até ficar concluído ou com erro.
+    Tem a sua própria sessão (do SessionFactory, não a scoped: com reserva antecipada há
+    vários documentos vivos na mesma thread, e um commit/close de um não pode afetar os outros) e (se veio da fila) o heartbeat da lease, que começa logo
+    na reserva: o documento pode ficar à espera enquanto o anterior ainda está na inferência.
+    """
+    def __init__(self, document_id: int, worker_id: str = None):
+        self.document_id = document_id
+        self.worker_id = worker_id
+        self.db = SessionFactory()
+        # Copiados do Document no start(): depois disso não se lê a instância ORM
+        self.storage_path = None
+        self.num_paginas = 0
+        self.pending_pages = []
+        self.finished = False
+        self.heartbeat = LeaseHeartbeat(document_id, worker_id) if worker_id else None
+        if self.heartbeat:
+            self.heartbeat.__enter__()
+
+    def start(self) -> bool:
+        """Prepara o documento (nº de páginas, páginas já feitas). False se não há nada a fazer."""
+        print(f"▶️ A iniciar processamento do documento {self.document_id}...")
+        db = self.db
         try:
-            document.status = "error"
+            document = db.get(Document, self.document_id)
+            if not document:
+                print(f"❌ Documento {self.document_id} não encontrado.")
+                self.close()
+                return False
+
+            # Bloquear o documento (status 'processing') para ninguém mais mexer
+            # (quando vem da fila, o claim_next_document já o fez com lock na BD)
+            if self.worker_id is None:
+                document.status = "processing"
+                db.flush()
+
+            # Páginas já guardadas numa tentativa anterior (worker que morreu a meio)
+            done_pages = {
+                pagina for (pagina,) in db.query(OCRResultado.pagina)
+                .filter(OCRResultado.document_id == self.document_id)
+            }
+            self.storage_path = document.storage_path
+            self.num_paginas = count_pages(self.storage_path)
+            fenced_update(db, self.document_id, self.worker_id, {
+                Document.num_paginas: self.num_paginas,
+                Document.paginas_processadas: len(done_pages),
+            })
             db.commit()
-        except:
-            pass
+
+            print(f"   📂 Ficheiro: {self.storage_path} ({self.num_paginas} páginas)")
+            if done_pages:
+                print(f"   ⏩ {len(done_pages)} páginas já processadas anteriormente.")
+            self.pending_pages = [
+                n for n in range(1, self.num_paginas + 1) if n not in done_pages
+            ]
+            return True
+        except Exception as e:
+            self.fail(e)
+            return False
+
+    def jobs(self):
+        """Jobs do pipeline: as páginas em falta e o marcador de fim do documento."""
+        for page_number in self.pending_pages:
+            yield self, self.storage_path, page_number
+        yield self, None, None
+
+    def process(self, page_number: int, prepared):
+        """Inferência e gravação de uma página já pré-processada (ou fim do documento)."""
+        if self.finished:
+            return  # Documento que já falhou: as páginas que sobraram no pipeline são ignoradas
+        try:
+            if page_number is None:
+                self.complete()
+                return
+            page_number, regions, timings = prepared.result()
+            observe_stages(timings)
+            process_page(self.db, self.document_id, page_number, regions, self.worker_id)
+            print(f"   📄 Documento {self.document_id}: página {page_number}/{self.num_paginas} concluída.")
+        except Exception as e:
+            self.fail(e)
+
+    def complete(self):
+        # Finalizar: confiança do documento = média de todas as linhas de todas as páginas
+        db = self.db
+        confidence = db.query(func.avg(OCRSegmento.confidence))\
+            .join(OCRResultado, OCRSegmento.ocr_resultado_id == OCRResultado.id)\
+            .filter(OCRResultado.document_id == self.document_id)\
+            .scalar() or 0.0
+        fenced_update(db, self.document_id, self.worker_id, {
+            Document.confidence_global: confidence,
+            Document.status: "ocr_completed",
+            Document.locked_by: None,
+            Document.lease_expires_at: None,
+        })
+        db.commit()
+        DOCUMENTS_PROCESSED.labels("ocr_completed").inc()
+        print(f"✅ Documento {self.document_id} concluído com sucesso!")
+        if cache_stats() is not None:
+            print(f"   🗃️ Cache de linhas: {cache_stats()}")
+        self.close()
+
+    def fail(self, error: Exception):
+        db = self.db
         db.rollback()
+        if isinstance(error, LeaseLost):
+            # Outro worker retomou o documento: parar sem mexer no estado dele
+            print(f"⚠️ {error}. A abandonar o documento.")
+        else:
+            print(f"❌ Erro crítico ao processar {self.document_id}: {error}")
+            DOCUMENTS_PROCESSED.labels("error").inc()
+            # Marcar como erro para não ficar preso em 'processing' para sempre
+            # (e devolver à fila os uploads repetidos que esperavam por este)
+            try:
+                release_duplicates(db, self.document_id)
+                fenced_update(db, self.document_id, self.worker_id, {
+                    Document.status: "error",
+                    Document.locked_by: None,
+                    Document.lease_expires_at: None,
+                })
+                db.commit()
+            except:
+                db.rollback()
+        self.close()
+
+    def close(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.heartbeat:
+            self.heartbeat.__exit__(None, None, None)
+        self.db.close()
+
+
+def process_documents(document_ids, pool=None, worker_id: str = None) -> int:
+    """
+    Processa uma sequência de documentos num só pipeline em streaming: o pool
+    (processos OpenCV) renderiza, limpa e segmenta as próximas páginas, deste
+    documento ou dos seguintes, enquanto esta thread faz a inferência.
+    'document_ids' pode ser preguiçoso: o próximo id só é pedido quando as páginas
+    do documento atual já entraram todas no pipeline (reserva antecipada).
+    Devolve o nº de documentos processados.
+    """
+    runs = []  # Documentos ainda em curso (para os libertar se o ciclo parar a meio)
+    count = 0
+
+    def started_runs():
+        nonlocal count
+        for document_id in document_ids:
+            run = DocumentRun(document_id, worker_id)
+            runs[:] = [r for r in runs if not r.finished] + [run]
+            count += 1
+            if run.start():
+                yield run
+
+    def page_jobs():
+        for run in started_runs():
+            yield from run.jobs()
+
+    try:
+        for run, page_number, prepared in iter_prepared_pages(page_jobs(), pool):
+            run.process(page_number, prepared)
     finally:
-        db.close()
+        # Paragem a meio (ex: Ctrl+C): libertar sessões e heartbeats
+        for run in runs:
+            run.close()
+    return count
 
-def start_worker():
-    print("👷 OCR Worker Automático iniciado! A aguardar documentos...")
-    print("   (Pressione Ctrl+C para parar)")
-    
+
+def process_document(document_id: int, pool=None, worker_id: str = None):
+    """Processa um só documento (fora do ciclo do worker, ex: benchmarks)."""
+    process_documents([document_id], pool, worker_id)
+
+
+def claim_documents(worker_id: str):
+    """
+    Gerador de ids de documentos reservados para este worker (FOR UPDATE SKIP LOCKED),
+    um de cada vez e só quando pedido. Termina quando a fila está vazia (ou a BD falha).
+    """
     while True:
-        db = SessionLocal()
+        db = SessionFactory()
         try:
-            # Procura o documento mais antigo que ainda esteja como 'uploaded'
-            pending_doc = db.query(Document)\
-                .filter(Document.status == "uploaded")\
-                .order_by(Document.created_at.asc())\
-                .first()
-
-            if pending_doc:
-                # Encontrou trabalho! Mãos à obra.
-                process_document(pending_doc.id)
-            else:
-                # Não há trabalho? Dorme 2 segundos e tenta de novo.
-                time.sleep(2)
-                
+            document_id = claim_next_document(db, worker_id)
+            QUEUE_DEPTH.set(count_pending_documents(db))
         except Exception as e:
             print(f"⚠️ Erro no ciclo do worker: {e}")
-            time.sleep(5)
+            db.rollback()
+            return
         finally:
             db.close()
 
+        if not document_id:
+            return
+        yield document_id
+
+
+def start_worker():
+    worker_id = make_worker_id()
+    print(f"👷 OCR Worker Automático iniciado ({worker_id})! A aguardar documentos...")
+    print("   (Pressione Ctrl+C para parar)")
+
+    # Métricas do worker (Prometheus) em http://<host>:<porta>/metrics
+    # (com vários workers na máquina, cada um fica numa porta a partir da WORKER_METRICS_PORT)
+    if WORKER_METRICS_PORT:
+        port = start_metrics_server(WORKER_METRICS_PORT, WORKER_METRICS_PORTS)
+        if port:
+            print(f"   📊 Métricas em :{port}/metrics")
+
+    # Ligação dedicada em LISTEN: o upload faz NOTIFY e o worker acorda logo
+    listener = QueueListener()
+
+    # Processos para as etapas OpenCV (criados antes de qualquer inferência)
+    pool = create_preprocess_pool()
+
+    try:
+        while True:
+            # Processa documentos enquanto houver fila (com heartbeat da lease em cada um);
+            # o seguinte é reservado e pré-processado enquanto o atual está na inferência
+            try:
+                processed = process_documents(claim_documents(worker_id), pool, worker_id)
+            except Exception as e:
+                # Erro fora de um documento (ex: BD em baixo a meio do pipeline): não matar o worker
+                print(f"⚠️ Erro no ciclo do worker: {e}")
+                time.sleep(5)
+                continue
+            if not processed:
+                # Não há trabalho? Dorme até chegar um NOTIFY.
+                # O timeout serve para recuperar leases expiradas de workers que morreram.
+                listener.wait(WORKER_IDLE_TIMEOUT)
+    finally:
+        listener.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        crop_writer.shutdown()
+
 if __name__ == "__main__":
-    start_worker()
\ No newline at end of file
+    start_worker()
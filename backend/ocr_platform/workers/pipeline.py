@@ -0,0 +1,117 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+
+from ml.preprocessing.image import render_page, preprocess_page, segment_regions, timed
+from app.core.config import (
+    PREPROCESS_WORKERS, PREPROCESS_QUEUE_SIZE, PREPROCESS_PROFILE,
+    SEGMENT_SPLIT_WORDS, SEGMENT_MAX_ASPECT, SEGMENT_MIN_GAP_RATIO
+)
+
+
+def _init_preprocess_process():
+    # Cada processo usa 1 thread do OpenCV: o paralelismo vem do nº de processos
+    cv2.setNumThreads(1)
+
+
+def prepare_page(path: str, page_number: int):
+    """
+    Etapa CPU (OpenCV) de uma página: renderizar, limpar e segmentar.
+    Corre num processo do pool; só recebe o caminho para não copiar imagens.
+    Devolve (numero_pagina, regiões, tempos por etapa) - ver segment_regions.
+    Os tempos voltam com o resultado porque as métricas vivem no processo principal.
+    """
+    timings = {}
+    img = timed(timings, "load", render_page, path, page_number)
+    clean = preprocess_page(img, PREPROCESS_PROFILE, timings)
+    regions = timed(
+        timings, "segmentation", segment_regions, clean,
+        SEGMENT_SPLIT_WORDS, SEGMENT_MAX_ASPECT, SEGMENT_MIN_GAP_RATIO
+    )
+    return page_number, regions, timings
+
+
+def create_preprocess_pool(workers: int = PREPROCESS_WORKERS):
+    """
+    Cria o pool das etapas OpenCV (ou None se workers == 0).
+    Usa 'fork' para que os processos filhos não voltem a importar o worker
+    (e o modelo TrOCR). Onde não há fork (Windows), usa threads: as funções
+    pesadas do OpenCV libertam o GIL, por isso continua a haver sobreposição.
+    """
+    if workers <= 0:
+        return None
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_preprocess_process
+        )
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def _run_now(fn, *args) -> Future:
+    """Executa já (sem pool) e devolve o resultado (ou a exceção) num Future."""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def iter_prepared_pages(jobs, pool=None, max_pending: int = PREPROCESS_QUEUE_SIZE):
+    """
+    Gerador de (tag, numero_pagina, future) pela ordem dos jobs (tag, caminho, numero_pagina).
+    O future dá (numero_pagina, regiões, tempos) ou a exceção dessa página,
+    para quem consome decidir o que falha (só o documento dela, não o worker).
+    Os jobs podem atravessar vários documentos: com pool, as páginas dos próximos
+    documentos vão sendo pré-processadas enquanto a inferência trabalha neste.
+    Jobs com caminho None são marcadores (ex: fim de documento) e passam sem trabalho.
+    No máximo 'max_pending' jobs ficam em curso/à espera (backpressure); os jobs
+    só são pedidos ao iterador quando há lugar, por isso este pode ser preguiçoso
+    (ex: reservar o documento seguinte só quando as páginas do atual já entraram).
+    """
+    jobs = iter(jobs)
+    pending = deque()
+
+    def submit_next():
+        for tag, path, page_number in jobs:
+            # Sem pool, a página só é preparada quando chega a vez dela
+            future = pool.submit(prepare_page, path, page_number) if pool is not None and path else None
+            pending.append((tag, path, page_number, future))
+            return
+
+    # Sem pool não há nada para adiantar (nem documentos para reservar mais cedo)
+    for _ in range(max(1, max_pending) if pool is not None else 1):
+        submit_next()
+
+    try:
+        while pending:
+            tag, path, page_number, future = pending.popleft()
+            if path and future is None:
+                future = _run_now(prepare_page, path, page_number)
+            elif future is not None:
+                # Esperar pela página antes de pedir outra: a fila não cresce além do limite
+                future.exception()
+            # Libertou-se um lugar na fila: pedir o próximo job
+            submit_next()
+            yield tag, page_number, future
+    finally:
+        # Se o consumidor parar a meio (erro), não deixar trabalho pendurado
+        for _, _, _, future in pending:
+            if future is not None:
+                future.cancel()
+
+
+def iter_segmented_pages(path: str, page_numbers, pool=None, max_pending: int = PREPROCESS_QUEUE_SIZE):
+    """
+    Gerador de (numero_pagina, regiões, tempos) de um só ficheiro, pela ordem das páginas.
+    Com pool, as próximas páginas vão sendo pré-processadas enquanto quem
+    consome o gerador (a inferência) trabalha na página atual.
+    """
+    jobs = ((None, path, page_number) for page_number in page_numbers)
+    for _, _, future in iter_prepared_pages(jobs, pool, max_pending):
+        yield future.result()